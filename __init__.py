@@ -41,6 +41,7 @@ import bpy
 from bpy.props import (
         BoolProperty,
         FloatProperty,
+        IntProperty,
         StringProperty,
         )
 from bpy_extras.io_utils import (
@@ -58,18 +59,13 @@ from . import export_cocos2dx
 IOCocos2dxOrientationHelper = orientation_helper_factory('IOCocos2dxOrientationHelper', axis_forward='-Z', axis_up='Y')
 
 
-class ExportCocos2dx(bpy.types.Operator, ExportHelper, IOCocos2dxOrientationHelper):
-    """Export to a Cocos2d-x text file"""
+class ExportCocos2dxHelper(ExportHelper, IOCocos2dxOrientationHelper):
+    """A mix-in with the options and the logic shared by the text and the binary export operator.
 
-    bl_idname = 'export_scene.cocos2dx'
-    bl_label = 'Export Cocos2d-x'
-    bl_options = {'PRESET'}
+    The operators derived from this class have to define the file_format, which is passed on to the exporter.
+    """
 
-    filename_ext = '.c3t'
-    filter_glob = StringProperty(
-            default='*.c3t',
-            options={'HIDDEN'},
-            )
+    bl_options = {'PRESET'}
 
     # context group
     use_selection = BoolProperty(
@@ -91,6 +87,34 @@ class ExportCocos2dx(bpy.types.Operator, ExportHelper, IOCocos2dxOrientationHelp
             default=True,
             )
 
+    export_tangents = BoolProperty(
+            name="Export Tangents",
+            description="Exports the tangents and binormals of the first UV map for normal mapping",
+            default=False,
+            )
+
+    export_animations = BoolProperty(
+            name="Export Animations",
+            description="Exports the actions, which animate the bones of the armatures, as animations",
+            default=True,
+            )
+
+    export_animations_only = BoolProperty(
+            name="Animations Only",
+            description="Export the animations only and skip the meshes, materials and nodes, which makes "
+                        "re-exporting changed actions very fast",
+            default=False,
+            )
+
+    keyframe_tolerance = FloatProperty(
+            name="Keyframe Tolerance",
+            description="Drop the keys of a bone's rotation, scale and translation, which can be interpolated from "
+                        "the remaining keys with at most this error (0 keeps all keys)",
+            min=0.0, max=1.0,
+            precision=5,
+            default=0.0001,
+            )
+
     # object group
     use_mesh_modifiers = BoolProperty(
             name="Apply Modifiers",
@@ -104,6 +128,54 @@ class ExportCocos2dx(bpy.types.Operator, ExportHelper, IOCocos2dxOrientationHelp
             default=False,
             )
 
+    use_geometry_cache = BoolProperty(
+            name="Cache Geometry",
+            description="Store the processed geometry in a cache file next to the exported file and reuse it for "
+                        "unchanged objects in the next export",
+            default=False,
+            )
+
+    num_processes = IntProperty(
+            name="Processes",
+            description="The number of worker processes, which process the geometry of the objects (0 uses one "
+                        "process per CPU core)",
+            min=0,
+            default=0,
+            )
+
+    use_vertex_cache_optimization = BoolProperty(
+            name="Optimize Vertex Cache",
+            description="Reorder the triangles of every mesh part to make better use of the GPU's vertex cache and "
+                        "store the vertices in the order in which the triangles use them",
+            default=False,
+            )
+
+    use_streaming_output = BoolProperty(
+            name="Low Memory",
+            description="Write every mesh to the file as soon as it has been processed and free it afterwards, which "
+                        "keeps the memory usage low for large scenes (the meshes are processed one after the other)",
+            default=False,
+            )
+
+    use_profiling = BoolProperty(
+            name="Profile",
+            description="Measure the time of every stage of the export and report it in the info editor",
+            default=False,
+            )
+
+    write_profile = BoolProperty(
+            name="Write Profile",
+            description="Write the time of every stage of the export to a JSON file next to the exported file",
+            default=False,
+            )
+
+    trace_memory = BoolProperty(
+            name="Trace Memory",
+            description="Add the peak memory of every stage to the profile (slows down the export and distorts "
+                        "the times)",
+            default=False,
+            )
+
     global_scale = FloatProperty(
             name="Scale",
             min=0.01, max=1000.0,
@@ -134,6 +206,7 @@ class ExportCocos2dx(bpy.types.Operator, ExportHelper, IOCocos2dxOrientationHelp
                                             'global_scale',
                                             'path_mode'
                                             ))
+        keywords['file_format'] = self.file_format
 
         # Create a matrix which incorporates the global scale and the rotation to match Cocos2d-x's coordinate frame.
         global_matrix = (Matrix.Scale(self.global_scale, 4)
@@ -144,9 +217,68 @@ class ExportCocos2dx(bpy.types.Operator, ExportHelper, IOCocos2dxOrientationHelp
         exporter = export_cocos2dx.Exporter(context=context, source_filepath=bpy.data.filepath,
                                             dest_filepath=self.filepath, path_mode=self.path_mode)
         exporter.run(context, **keywords)
+        self.report({'INFO'}, exporter.format_stats())
+        if self.use_profiling or self.write_profile:
+            self.report({'INFO'}, exporter.format_profile())
         return {'FINISHED'}
 
 
+class ExportCocos2dx(bpy.types.Operator, ExportCocos2dxHelper):
+    """Export to a Cocos2d-x text file"""
+
+    bl_idname = 'export_scene.cocos2dx'
+    bl_label = 'Export Cocos2d-x'
+
+    file_format = 'C3T'
+    filename_ext = '.c3t'
+    filter_glob = StringProperty(
+            default='*.c3t',
+            options={'HIDDEN'},
+            )
+
+    # output group
+    use_compact_output = BoolProperty(
+            name="Compact",
+            description="Write the file without whitespace and round the vertex attributes",
+            default=False,
+            )
+
+    position_precision = IntProperty(
+            name="Position Precision",
+            description="Number of decimal places of the vertex positions in compact output",
+            default=5,
+            min=1, max=7,
+            )
+
+    normal_precision = IntProperty(
+            name="Normal Precision",
+            description="Number of decimal places of the normal vectors in compact output",
+            default=4,
+            min=1, max=7,
+            )
+
+    uv_precision = IntProperty(
+            name="UV Precision",
+            description="Number of decimal places of the UV coordinates in compact output",
+            default=4,
+            min=1, max=7,
+            )
+
+
+class ExportCocos2dxBinary(bpy.types.Operator, ExportCocos2dxHelper):
+    """Export to a Cocos2d-x binary file"""
+
+    bl_idname = 'export_scene.cocos2dx_binary'
+    bl_label = 'Export Cocos2d-x Binary'
+
+    file_format = 'C3B'
+    filename_ext = '.c3b'
+    filter_glob = StringProperty(
+            default='*.c3b',
+            options={'HIDDEN'},
+            )
+
+
 class Cocos2dxExporterPreferences(bpy.types.AddonPreferences):
     """The add-on preferences, which are shown in a panel in the Add-ons tab in Blender User Settings.
     """
@@ -193,17 +325,20 @@ class Cocos2dxExporterPreferences(bpy.types.AddonPreferences):
 
 def menu_func_export(self, context):
     self.layout.operator(ExportCocos2dx.bl_idname, text='Cocos2d-x (.c3t)')
+    self.layout.operator(ExportCocos2dxBinary.bl_idname, text='Cocos2d-x (.c3b)')
 
 
 def register():
     addon_updater_ops.register(bl_info)
     bpy.utils.register_class(Cocos2dxExporterPreferences)
     bpy.utils.register_class(ExportCocos2dx)
+    bpy.utils.register_class(ExportCocos2dxBinary)
     bpy.types.INFO_MT_file_export.append(menu_func_export)
 
 
 def unregister():
     bpy.types.INFO_MT_file_export.remove(menu_func_export)
+    bpy.utils.unregister_class(ExportCocos2dxBinary)
     bpy.utils.unregister_class(ExportCocos2dx)
     bpy.utils.unregister_class(Cocos2dxExporterPreferences)
     addon_updater_ops.unregister()
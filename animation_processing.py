@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# ====---------------------------------------------------------------------====
+#     This is a Blender addon for exporting a scene to Cocos2d-x in
+#     its JSON file format (c3t).
+#     Created by Manuel Freiberger.
+#
+#     This module holds the processing stage of the animation export. It
+#     works on plain tuples only and must not import bpy.
+# ====---------------------------------------------------------------------====
+
+import math
+
+
+def lerp(a, b, t):
+    """Interpolates linearly between the vectors a and b.
+    """
+    return tuple(x + (y - x) * t for x, y in zip(a, b))
+
+
+def slerp(a, b, t):
+    """Interpolates spherically between the unit quaternions a and b along the short arc.
+
+    The quaternions are tuples (x, y, z, w).
+    """
+    dot = sum(x * y for x, y in zip(a, b))
+    if dot < 0:
+        b = tuple(-y for y in b)
+        dot = -dot
+    if dot > 0.9995:
+        # The quaternions are almost equal, so the linear interpolation is accurate and numerically stable.
+        result = lerp(a, b, t)
+        norm = math.sqrt(sum(x * x for x in result))
+        return tuple(x / norm for x in result)
+    angle = math.acos(dot)
+    sin_angle = math.sin(angle)
+    weight_a = math.sin((1 - t) * angle) / sin_angle
+    weight_b = math.sin(t * angle) / sin_angle
+    return tuple(x * weight_a + y * weight_b for x, y in zip(a, b))
+
+
+def get_interpolation_error(a, b):
+    """Returns the largest difference between the components of a and b.
+    """
+    return max(abs(x - y) for x, y in zip(a, b))
+
+
+def can_interpolate(keytimes, values, start, end, tolerance, interpolate=lerp):
+    """Returns True, if interpolate() reproduces the values of all keys between start and end from the values at
+    start and end with an error of at most the tolerance in every component.
+    """
+    start_time = keytimes[start]
+    duration = keytimes[end] - start_time
+    for key in range(start + 1, end):
+        interpolated = interpolate(values[start], values[end], (keytimes[key] - start_time) / duration)
+        if get_interpolation_error(interpolated, values[key]) > tolerance:
+            return False
+    return True
+
+
+def reduce_keys(keytimes, values, tolerance, interpolate=lerp):
+    """Removes the keys of a channel, which can be interpolated from the remaining keys.
+
+    The keytimes must be increasing and the values hold the value of the channel at every key time. A key is
+    removed, if interpolate() reproduces its value from the surrounding kept keys with an error of at most the
+    tolerance in every component. Starting at the last kept key, the end of the next segment is found by doubling
+    its length until a key inside of it cannot be reproduced anymore and by a binary search between the last two
+    lengths afterwards. As every check visits the keys of its segment once, this takes O(n log n) time rather than
+    O(n²) for long segments. A constant channel is reduced to its first key. Returns the increasing indices of the
+    kept keys.
+    """
+    num_keys = len(values)
+    if num_keys <= 1 or tolerance <= 0:
+        return list(range(num_keys))
+    if all(get_interpolation_error(values[0], value) <= tolerance for value in values):
+        return [0]
+
+    kept = [0]
+    start = 0
+    last = num_keys - 1
+    while start < last:
+        # The keys start and good can always be connected, the keys start and bad cannot.
+        good = start + 1
+        bad = None
+        length = 2
+        while good < last:
+            end = min(start + length, last)
+            if not can_interpolate(keytimes, values, start, end, tolerance, interpolate):
+                bad = end
+                break
+            good = end
+            length *= 2
+        if bad is not None:
+            while bad - good > 1:
+                middle = (good + bad) // 2
+                if can_interpolate(keytimes, values, start, middle, tolerance, interpolate):
+                    good = middle
+                else:
+                    bad = middle
+        kept.append(good)
+        start = good
+    return kept
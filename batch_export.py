@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# ====---------------------------------------------------------------------====
+#     A command-line driver, which exports many .blend files to Cocos2d-x
+#     in parallel Blender processes. Run it with
+#
+#         blender --background --python batch_export.py -- [options] FILE...
+#
+#     Every FILE is either a .blend file or a pair INPUT.blend=OUTPUT.c3t.
+#     Created by Manuel Freiberger.
+# ====---------------------------------------------------------------------====
+
+import argparse
+import importlib
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+
+# The extension of the exported file for every file format.
+FILE_FORMAT_EXTENSIONS = {'C3T': '.c3t', 'C3B': '.c3b'}
+
+
+class Job:
+    """The export of one .blend file.
+
+    After the job has been run, it holds the exit code of the Blender process, the output of the process and the
+    time it took in seconds.
+    """
+    def __init__(self, source_filepath, dest_filepath):
+        self.source_filepath = source_filepath
+        self.dest_filepath = dest_filepath
+        self.returncode = None
+        self.output = ''
+        self.duration = 0.0
+
+
+def parse_job(argument, output_dir, file_format):
+    """Creates the job for a FILE argument.
+
+    Without an explicit output path, the file is exported next to the .blend file or into the output_dir.
+    """
+    source_filepath, separator, dest_filepath = argument.partition('=')
+    if not separator:
+        dest_filepath = os.path.splitext(source_filepath)[0] + FILE_FORMAT_EXTENSIONS[file_format]
+        if output_dir:
+            dest_filepath = os.path.join(output_dir, os.path.basename(dest_filepath))
+    return Job(os.path.abspath(source_filepath), os.path.abspath(dest_filepath))
+
+
+def make_argument_parser():
+    """Creates the parser for the command-line options.
+
+    The options, which are passed on to the exporter, are shared by the controller and the worker processes.
+    """
+    parser = argparse.ArgumentParser(
+            prog='blender --background --python batch_export.py --',
+            description="Exports .blend files to Cocos2d-x in parallel Blender processes.")
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help="A .blend file or a pair INPUT.blend=OUTPUT.c3t (or .c3b)")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help="The number of parallel Blender processes (default: one per CPU core)")
+    parser.add_argument('-o', '--output-dir',
+                        help="The directory for files without an explicit output path (default: next to the "
+                             ".blend file)")
+    parser.add_argument('-f', '--format', choices=sorted(FILE_FORMAT_EXTENSIONS), default='C3T',
+                        help="The file format for files without an explicit output path (default: C3T)")
+    parser.add_argument('--blender',
+                        help="The Blender executable (default: the running Blender or 'blender')")
+    parser.add_argument('--worker', metavar='OUTPUT', help=argparse.SUPPRESS)
+
+    # The export options.
+    parser.add_argument('--selection-only', action='store_true',
+                        help="Export the objects, which are selected in the .blend file, only")
+    parser.add_argument('--no-normals', action='store_true', help="Do not export the normals")
+    parser.add_argument('--no-uv-maps', action='store_true', help="Do not export the UV maps and textures")
+    parser.add_argument('--tangents', action='store_true', help="Export the tangents and binormals")
+    parser.add_argument('--no-animations', action='store_true', help="Do not export the animations")
+    parser.add_argument('--animations-only', action='store_true',
+                        help="Export the animations only, without meshes, materials and nodes")
+    parser.add_argument('--keyframe-tolerance', type=float, default=0.0001,
+                        help="The error, with which keys are dropped from the animations (default: 0.0001)")
+    parser.add_argument('--no-modifiers', action='store_true', help="Do not apply the modifiers")
+    parser.add_argument('--render-modifiers', action='store_true',
+                        help="Use the render settings when applying the modifiers")
+    parser.add_argument('--cache', action='store_true', help="Use a geometry cache next to every exported file")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="The number of worker processes per Blender process (default: 1)")
+    parser.add_argument('--optimize-vertex-cache', action='store_true',
+                        help="Reorder the triangles for the GPU's vertex cache")
+    parser.add_argument('--compact', action='store_true', help="Write compact c3t files")
+    parser.add_argument('--low-memory', action='store_true',
+                        help="Write every mesh as soon as it has been processed to bound the memory usage")
+    parser.add_argument('--profile', action='store_true',
+                        help="Print the time of every stage of the export")
+    parser.add_argument('--write-profile', action='store_true',
+                        help="Write the time of every stage to a .profile.json file next to every exported file")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Add the peak memory of every stage to the profile (slows down the export and distorts "
+                             "the times)")
+    parser.add_argument('--scale', type=float, default=1.0, help="The global scale (default: 1.0)")
+    parser.add_argument('--axis-forward', default='-Z', help="The forward axis (default: -Z)")
+    parser.add_argument('--axis-up', default='Y', help="The up axis (default: Y)")
+    parser.add_argument('--path-mode', default='AUTO',
+                        choices=('AUTO', 'ABSOLUTE', 'RELATIVE', 'MATCH', 'STRIP', 'COPY'),
+                        help="How the paths of the textures are written (default: AUTO)")
+    return parser
+
+
+def get_script_arguments():
+    """Returns the arguments for this script.
+
+    Inside of Blender, these are the arguments after '--'.
+    """
+    if '--' in sys.argv:
+        return sys.argv[sys.argv.index('--') + 1:]
+    try:
+        import bpy
+    except ImportError:
+        return sys.argv[1:]
+    # Blender has consumed all arguments.
+    return []
+
+
+def get_export_arguments(args):
+    """Returns the command-line arguments of the export options, which are passed on to the worker processes.
+    """
+    arguments = ['--processes', str(args.processes),
+                 '--scale', repr(args.scale),
+                 '--keyframe-tolerance', repr(args.keyframe_tolerance),
+                 '--axis-forward', args.axis_forward,
+                 '--axis-up', args.axis_up,
+                 '--path-mode', args.path_mode]
+    for option in ('selection_only', 'no_normals', 'no_uv_maps', 'tangents', 'no_animations', 'animations_only',
+                   'no_modifiers', 'render_modifiers', 'cache', 'optimize_vertex_cache', 'compact', 'low_memory',
+                   'profile', 'write_profile', 'trace_memory'):
+        if getattr(args, option):
+            arguments.append('--' + option.replace('_', '-'))
+    return arguments
+
+
+def import_exporter():
+    """Imports the export_cocos2dx module of the add-on, to which this script belongs.
+
+    The add-on does not have to be enabled. Its directory is imported as a package, because the exporter uses relative
+    imports.
+    """
+    addon_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, os.path.dirname(addon_dir))
+    try:
+        return importlib.import_module(os.path.basename(addon_dir) + '.export_cocos2dx')
+    finally:
+        sys.path.pop(0)
+
+
+def run_worker(args):
+    """Exports the .blend file, which has been loaded by this Blender process, to args.worker.
+
+    Returns the exit code of the process.
+    """
+    import bpy
+    from bpy_extras.io_utils import axis_conversion
+    from mathutils import Matrix
+
+    try:
+        export_cocos2dx = import_exporter()
+        file_format = 'C3B' if args.worker.lower().endswith('.c3b') else 'C3T'
+        # Create a matrix which incorporates the global scale and the rotation to match Cocos2d-x's coordinate frame.
+        global_matrix = (Matrix.Scale(args.scale, 4)
+                         * axis_conversion(to_forward=args.axis_forward,
+                                           to_up=args.axis_up).to_4x4())
+        exporter = export_cocos2dx.Exporter(context=bpy.context, source_filepath=bpy.data.filepath,
+                                            dest_filepath=args.worker, path_mode=args.path_mode)
+        exporter.run(bpy.context,
+                     global_matrix=global_matrix,
+                     file_format=file_format,
+                     use_selection=args.selection_only,
+                     export_normals=not args.no_normals,
+                     export_uv_maps=not args.no_uv_maps,
+                     export_tangents=args.tangents,
+                     export_animations=not args.no_animations,
+                     export_animations_only=args.animations_only,
+                     keyframe_tolerance=args.keyframe_tolerance,
+                     use_mesh_modifiers=not args.no_modifiers,
+                     use_mesh_modifiers_render=args.render_modifiers,
+                     use_geometry_cache=args.cache,
+                     num_processes=args.processes,
+                     use_vertex_cache_optimization=args.optimize_vertex_cache,
+                     use_compact_output=args.compact,
+                     use_streaming_output=args.low_memory,
+                     use_profiling=args.profile,
+                     write_profile=args.write_profile,
+                     trace_memory=args.trace_memory)
+        print(exporter.format_stats())
+        if args.profile or args.write_profile:
+            print(exporter.format_profile())
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def run_job(job, blender, export_arguments):
+    """Runs the job in a new Blender process and waits for it to finish.
+    """
+    command = [blender, '--background', '--factory-startup', job.source_filepath,
+               '--python', os.path.abspath(__file__), '--', '--worker', job.dest_filepath] + export_arguments
+    start_time = time.perf_counter()
+    if not os.path.isfile(job.source_filepath):
+        # Blender would start with an empty scene instead.
+        job.returncode = -1
+        job.output = 'File not found: {}'.format(job.source_filepath)
+        return
+    try:
+        os.makedirs(os.path.dirname(job.dest_filepath), exist_ok=True)
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                 universal_newlines=True)
+        job.returncode = process.returncode
+        job.output = process.stdout
+    except OSError as error:
+        job.returncode = -1
+        job.output = str(error)
+    job.duration = time.perf_counter() - start_time
+
+
+def run_jobs(jobs, num_workers, blender, export_arguments, print_output=False):
+    """Runs the jobs in up to num_workers parallel Blender processes.
+
+    The jobs are put into a queue, from which the worker threads take the next job as soon as their previous Blender
+    process has finished. The output of a Blender process is printed, if the job fails or print_output is set.
+    """
+    job_queue = queue.Queue()
+    for job in jobs:
+        job_queue.put(job)
+    print_lock = threading.Lock()
+
+    def work():
+        while True:
+            try:
+                job = job_queue.get_nowait()
+            except queue.Empty:
+                return
+            run_job(job, blender, export_arguments)
+            with print_lock:
+                status = 'OK' if job.returncode == 0 else 'FAILED'
+                print('[{:6}] {:8.2f}s {}'.format(status, job.duration, job.source_filepath), flush=True)
+                if job.returncode != 0 or print_output:
+                    print(job.output, flush=True)
+
+    threads = [threading.Thread(target=work) for _ in range(max(1, min(num_workers, len(jobs))))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def print_summary(jobs, duration):
+    """Prints the timing of all jobs and the number of failures.
+    """
+    failed_jobs = [job for job in jobs if job.returncode != 0]
+    print()
+    print('Exported {} of {} files in {:.2f}s (sum of all jobs: {:.2f}s).'.format(
+            len(jobs) - len(failed_jobs), len(jobs), duration, sum(job.duration for job in jobs)))
+    if jobs:
+        slowest_job = max(jobs, key=lambda job: job.duration)
+        print('Slowest file: {} ({:.2f}s)'.format(slowest_job.source_filepath, slowest_job.duration))
+    for job in failed_jobs:
+        print('FAILED: {} (exit code {})'.format(job.source_filepath, job.returncode))
+
+
+def main():
+    """Runs the controller or, if this is a Blender process started by the controller, the worker.
+
+    Returns the exit code.
+    """
+    parser = make_argument_parser()
+    args = parser.parse_args(get_script_arguments())
+    if args.worker:
+        return run_worker(args)
+
+    if not args.files:
+        parser.error("no .blend files given")
+    jobs = [parse_job(argument, args.output_dir, args.format) for argument in args.files]
+    blender = args.blender
+    if not blender:
+        try:
+            import bpy
+            blender = bpy.app.binary_path
+        except ImportError:
+            blender = 'blender'
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    start_time = time.perf_counter()
+    run_jobs(jobs, args.jobs, blender, get_export_arguments(args), print_output=args.profile)
+    print_summary(jobs, time.perf_counter() - start_time)
+    return 1 if any(job.returncode != 0 for job in jobs) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
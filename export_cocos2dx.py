@@ -24,136 +24,356 @@
 #     Created by Manuel Freiberger.
 # ====---------------------------------------------------------------------====
 
+import math
 import os
+import pickle
+import re
 from collections import OrderedDict
-from math import inf
+from functools import partial
 
 import bpy
 import bpy_extras.io_utils
-from mathutils import Matrix
+from mathutils import Euler, Matrix, Quaternion
 
+from .animation_processing import lerp, reduce_keys, slerp
+from .export_core import (MAX_BONE_INFLUENCES, MeshSource, Model, build_meshes, make_attribute_desc,
+                          make_attribute_precisions)
+from .mesh_processing import (MAX_MESH_VERTICES, MeshData, ProcessedMesh, compute_aabb_per_vertex, hash_mesh_data,
+                              optimize_parts, optimize_vertex_cache, process_mesh_data,
+                              reorder_vertex_list_by_first_use, triangulate_quads)
+from .profiling import Profiler
+from .writers import BinaryWriter, Inline, JsonWriter, Table
 
-def triangulate_mesh(mesh):
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Matches the data path of an F-curve, which animates a pose bone. Captures the quoted bone name and the property.
+POSE_BONE_DATA_PATH = re.compile(r'^pose\.bones\["((?:[^"\\]|\\.)*)"\]\.(\w+)$')
+
+
+def triangulate_mesh(mesh, min_vertices=4):
+    """Triangulates the faces of the mesh, which have at least min_vertices vertices.
+    """
     import bmesh
     temp_mesh = bmesh.new()
     temp_mesh.from_mesh(mesh)
-    bmesh.ops.triangulate(temp_mesh, faces=temp_mesh.faces)
+    bmesh.ops.triangulate(temp_mesh, faces=[face for face in temp_mesh.faces if len(face.verts) >= min_vertices])
     temp_mesh.to_mesh(mesh)
     temp_mesh.free()
 
 
-class Table:
-    """A list wrapper, which adds an items_per_line attribute for pretty-printing.
+def is_triangulated(mesh):
+    """Returns True, if all polygons of the mesh are triangles.
+
+    Every polygon has at least three loops, so this is the case exactly if there are three loops per polygon.
     """
-    def __init__(self, items, num_items_per_line=1):
-        self.items = list(items)
-        self.items_per_line = num_items_per_line
+    return len(mesh.loops) == 3 * len(mesh.polygons)
+
 
-    def append(self, item):
-        self.items.append(item)
+def prepare_mesh(mesh, export_normals, export_tangents):
+    """Triangulates the mesh and computes the split normals and, if export_tangents is set, the tangents of the
+    first UV map, which are read by read_loop_attributes().
 
-    def extend(self, items):
-        self.items.extend(items)
+    A mesh, which consists of triangles only, is left as it is. With NumPy, quads are not triangulated either, but
+    split into triangles by read_mesh_data(), which is signalled by the return value True. Only polygons with more
+    than four vertices, which may be concave, are triangulated with bmesh. This also allows to compute the tangents,
+    which Blender supports for triangles and quads only.
+    """
+    split_quads = False
+    if not is_triangulated(mesh):
+        if np is not None:
+            loop_totals = np.empty(len(mesh.polygons), dtype=np.int32)
+            mesh.polygons.foreach_get('loop_total', loop_totals)
+            if np.any(loop_totals > 4):
+                triangulate_mesh(mesh, min_vertices=5)
+            split_quads = not is_triangulated(mesh)
+        else:
+            triangulate_mesh(mesh)
+    if export_tangents:
+        # This computes the split normals as well.
+        mesh.calc_tangents(uvmap=mesh.uv_layers[0].name)
+    elif export_normals:
+        mesh.calc_normals_split()
+    return split_quads
 
 
-class Inline:
-    """A wrapper to output lists in a single line.
+def read_loop_attributes(mesh, export_normals, num_uv_layers, export_tangents=False, skin_weights=None):
+    """Reads the vertex attributes of all loops of the mesh in bulk.
+
+    The result is a float32 array with one row per loop. Every row holds the position, the normal vector (if
+    export_normals is set), the coordinates of the first num_uv_layers UV maps and the tangent and the binormal (if
+    export_tangents is set) and the bone weights and bone indices from skin_weights (if given, see
+    read_skin_weights()), in this order. The v coordinate is flipped as Cocos2d-x has its texture origin in the
+    upper left corner. The normal vectors are the split normals of the loops, which honor flat faces, sharp edges
+    and custom normals. They and the tangents have to be computed before (see prepare_mesh()).
     """
-    def __init__(self, value):
-        self.value = value
+    num_loops = len(mesh.loops)
+    loop_vertex_indices = np.empty(num_loops, dtype=np.int32)
+    mesh.loops.foreach_get('vertex_index', loop_vertex_indices)
+
+    vertex_data = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+    mesh.vertices.foreach_get('co', vertex_data)
+    columns = [vertex_data.reshape(-1, 3)[loop_vertex_indices]]
+    if export_normals:
+        loop_normals = np.empty(num_loops * 3, dtype=np.float32)
+        mesh.loops.foreach_get('normal', loop_normals)
+        columns.append(loop_normals.reshape(-1, 3))
+    for uv_layer in mesh.uv_layers[:num_uv_layers]:
+        uv_data = np.empty(num_loops * 2, dtype=np.float32)
+        uv_layer.data.foreach_get('uv', uv_data)
+        uv_data = uv_data.reshape(-1, 2)
+        uv_data[:, 1] = 1 - uv_data[:, 1]
+        columns.append(uv_data)
+    if export_tangents:
+        # The binormal keeps Blender's direction, which points to the top of the image like the green channel of
+        # a normal map.
+        for attribute in ('tangent', 'bitangent'):
+            loop_vectors = np.empty(num_loops * 3, dtype=np.float32)
+            mesh.loops.foreach_get(attribute, loop_vectors)
+            columns.append(loop_vectors.reshape(-1, 3))
+    if skin_weights is not None:
+        columns.append(np.array(skin_weights, dtype=np.float32).reshape(-1, 2 * MAX_BONE_INFLUENCES)
+                       [loop_vertex_indices])
+    return np.hstack(columns)
 
 
-class JsonWriter:
-    """Serializes value in JSON format to fw.
+def read_polygon_data(mesh, num_uv_layers):
+    """Reads the per-polygon data of the mesh in bulk.
 
-    This is a straight forward implementation of a basic JSON encoder. This encoder is used rather than Python's
-    standard json package because it allows to hook in custom formatting of tables.
+    Returns a tuple (material_indices, loop_starts, loop_totals, layer_image_names). The first three are int32
+    arrays. The last one is a list with the image names per polygon (None without an image) for each of the first
+    num_uv_layers UV textures. Images are pointer properties, which cannot be read with foreach_get(), so the
+    image names are collected with one list comprehension per UV texture.
     """
-    def __init__(self):
-        self.int_format = '{}'
-        self.float_format = '{}'
-        self.fw = None
-        self.inline = False
-
-    def write(self, value, fw):
-        self.fw = fw
-        self._encode(value, 0)
-        self.fw('\n')
-
-    def _encode_list(self, lst, indent, items_per_line=1):
-        if not lst:
-            self.fw('[]')
-            return
-        indent += 1
-        nl = '\n' + '    ' * indent
-        sep = ''
-        self.fw('[')
-        for idx in range(len(lst)):
-            self.fw(sep)
-            sep = ', '
-            if not self.inline and idx % items_per_line == 0:
-                self.fw(nl)
-            self._encode(lst[idx], indent)
-        if not self.inline:
-            indent -= 1
-            nl = '\n' + '    ' * indent
-            self.fw(nl)
-        self.fw(']')
-
-    def _encode_dict(self, dct, indent):
-        if not dct:
-            self.fw('{}')
+    num_polygons = len(mesh.polygons)
+    material_indices = np.empty(num_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get('material_index', material_indices)
+    loop_starts = np.empty(num_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get('loop_start', loop_starts)
+    loop_totals = np.empty(num_polygons, dtype=np.int32)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    layer_image_names = [[face.image.name if face.image else None for face in uv_texture.data]
+                         for uv_texture in mesh.uv_textures[:num_uv_layers]]
+    return material_indices, loop_starts, loop_totals, layer_image_names
+
+
+def read_mesh_data(mesh, export_normals, num_uv_layers, export_tangents=False, skin_weights=None,
+                   split_quads=False):
+    """Reads all data of the mesh, which is needed by the processing stage, into a MeshData.
+
+    If split_quads is set (see prepare_mesh()), the quads of the mesh are split into triangles, which become the
+    polygons of the MeshData. Every triangle gets a copy of the attributes of its three loops, so the processing
+    stage does not need to know about the triangulation.
+    """
+    material_indices, loop_starts, loop_totals, layer_image_names = read_polygon_data(mesh, num_uv_layers)
+    loop_attributes = read_loop_attributes(mesh, export_normals, num_uv_layers, export_tangents, skin_weights)
+    if split_quads:
+        triangle_loops, polygon_indices = triangulate_quads(loop_starts, loop_totals, loop_attributes[:, :3])
+        loop_attributes = loop_attributes[triangle_loops]
+        material_indices = material_indices[polygon_indices]
+        layer_image_names = [np.array(image_names, dtype=object)[polygon_indices].tolist()
+                             for image_names in layer_image_names]
+        loop_starts = np.arange(0, len(triangle_loops), 3, dtype=np.int32)
+        loop_totals = np.full(len(polygon_indices), 3, dtype=np.int32)
+    material_names = [material.name if material else None for material in mesh.materials] or [None]
+    return MeshData(loop_attributes, material_indices, loop_starts, loop_totals, material_names, layer_image_names)
+
+
+class BlenderMeshSource(MeshSource):
+    """The mesh source for a mesh, which has been created from an object by to_mesh().
+
+    Before prepare() has been called, read_mesh_data() reads the polygons of the mesh as they are, e.g. to hash
+    them for the geometry cache. Afterwards, it reads the triangles, see prepare_mesh().
+    """
+    def __init__(self, name, mesh):
+        super().__init__(name)
+        self.mesh = mesh
+        self._split_quads = False
+
+    @property
+    def num_uv_layers(self):
+        return min(len(self.mesh.uv_layers), len(self.mesh.uv_textures))
+
+    def prepare(self, export_normals, export_tangents):
+        self._split_quads = prepare_mesh(self.mesh, export_normals, export_tangents)
+
+    def read_mesh_data(self, export_normals, num_uv_layers, export_tangents=False, skin_weights=None):
+        return read_mesh_data(self.mesh, export_normals, num_uv_layers, export_tangents, skin_weights,
+                              self._split_quads)
+
+
+def read_skin_weights(mesh, group_bone_indices):
+    """Reads the strongest bone influences of every vertex of the mesh.
+
+    The group_bone_indices map the index of every vertex group to the index of the bone, which is deformed by the
+    group, or to None. Returns a list with one row per vertex, which holds MAX_BONE_INFLUENCES weights, normalized
+    to a sum of 1, followed by as many bone indices. Unused influences have a zero weight and the bone index 0. A
+    vertex without any influence is bound to the first bone. The vertex groups are no RNA arrays, so they have to be
+    visited per vertex.
+    """
+    skin_weights = []
+    for vertex in mesh.vertices:
+        influences = sorted(((group.weight, group_bone_indices[group.group]) for group in vertex.groups
+                             if group.group < len(group_bone_indices)
+                             and group_bone_indices[group.group] is not None and group.weight > 0),
+                            key=lambda influence: -influence[0])[:MAX_BONE_INFLUENCES]
+        if not influences:
+            influences = [(1.0, 0)]
+        total_weight = sum(weight for weight, _ in influences)
+        influences += [(0.0, 0)] * (MAX_BONE_INFLUENCES - len(influences))
+        skin_weights.append([weight / total_weight for weight, _ in influences]
+                            + [float(bone_idx) for _, bone_idx in influences])
+    return skin_weights
+
+
+def process_mesh_per_loop(mesh, export_normals, num_uv_layers, export_tangents=False, skin_weights=None):
+    """Partitions the mesh and builds a vertex buffer without duplicates by visiting the loops one after the other.
+
+    This is the fallback of process_mesh_data() for Blender builds without NumPy. It returns a ProcessedMesh, whose
+    vertices are a flat list and whose indices are lists.
+    """
+    # Polygons with different (material, textures)-combinations belong to different parts of the mesh. We do this
+    # through a dict, where the names of the material and the textures are used as key.
+    materials = mesh.materials
+    if not materials:
+        materials = [None]
+    part_to_polygons_map = OrderedDict()
+    for poly in mesh.polygons:
+        material = materials[poly.material_index]
+        image_names = tuple(uv.data[poly.index].image.name if uv.data[poly.index].image else None
+                            for uv in mesh.uv_textures[:num_uv_layers])
+        key = (material.name if material else None, image_names)
+        if key not in part_to_polygons_map:
+            part_to_polygons_map[key] = ((poly.material_index, image_names), [])
+        part_to_polygons_map[key][1].append(poly)
+
+    # A mapping from vertex attributes to an integer index. Used to uniquify vertex data.
+    vertex_attributes_to_index_map = {}
+    num_unique_vertices = 0
+    vertex_attributes = []
+    parts = []
+    for material_key, polygons in part_to_polygons_map.values():
+        # A list of vertex indices which make up a polygon.
+        polygon_vertex_indices = []
+        for poly in polygons:
+            for vertex_idx, loop in zip(poly.vertices, poly.loop_indices):
+                # Collect all vertex attributes (position, normal vector, uv-coordinates...) in an array.
+                local_vertex_attributes = list(mesh.vertices[vertex_idx].co)
+                if export_normals:
+                    local_vertex_attributes.extend(mesh.loops[loop].normal)
+                for uv_idx in range(num_uv_layers):
+                    uv_coord = mesh.uv_layers[uv_idx].data[loop].uv
+                    local_vertex_attributes.extend([uv_coord[0], 1 - uv_coord[1]])
+                if export_tangents:
+                    local_vertex_attributes.extend(mesh.loops[loop].tangent)
+                    local_vertex_attributes.extend(mesh.loops[loop].bitangent)
+                if skin_weights is not None:
+                    local_vertex_attributes.extend(skin_weights[vertex_idx])
+                # Avoid storing duplicated vertex attributes.
+                vertex_key = tuple(local_vertex_attributes)
+                unique_idx = vertex_attributes_to_index_map.get(vertex_key)
+                if unique_idx is None:
+                    unique_idx = vertex_attributes_to_index_map[vertex_key] = num_unique_vertices
+                    num_unique_vertices += 1
+                    vertex_attributes.extend(local_vertex_attributes)
+
+                polygon_vertex_indices.append(unique_idx)
+        # The bounding box includes the vertices, which this part shares with previous parts.
+        stride = len(vertex_attributes) // num_unique_vertices if num_unique_vertices else 0
+        positions = [vertex_attributes[idx * stride:idx * stride + 3] for idx in set(polygon_vertex_indices)]
+        parts.append((material_key, polygon_vertex_indices, compute_aabb_per_vertex(positions)))
+    return ProcessedMesh(vertex_attributes, parts)
+
+
+class GeometryCache:
+    """A persistent cache of processed meshes, which is stored in a file next to the exported file.
+
+    The entries are keyed by the hash of the mesh data and the export options (see hash_mesh()). When the cache is
+    saved, only the entries which have been used since loading it are kept, so the cache does not grow without
+    bounds.
+    """
+    # Has to be incremented whenever the layout of the cached data changes.
+    VERSION = 3
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self._entries = {}
+        self._used_entries = {}
+
+    def load(self):
+        """Loads the cache file. A missing or unreadable file leaves the cache empty.
+        """
+        try:
+            with open(self.filepath, 'rb') as cache_file:
+                version, entries = pickle.load(cache_file)
+        except (OSError, EOFError, ValueError, TypeError, AttributeError, ImportError, pickle.UnpicklingError):
             return
-        indent += 1
-        nl = '\n' + '    ' * indent
-        sep = ''
-        self.fw('{' + nl)
-        for key, val in dct.items():
-            self.fw(sep)
-            if not sep:
-                sep = ',' + nl
-            self.fw('"{}": '.format(key))
-            self._encode(val, indent)
-        indent -= 1
-        nl = '\n' + '    ' * indent
-        self.fw(nl + '}')
-
-    def _encode(self, o, indent):
-        if isinstance(o, str):
-            self.fw('"{}"'.format(o))
-        elif o is None:
-            self.fw('null')
-        elif o is True:
-            self.fw('true')
-        elif o is False:
-            self.fw('false')
-        elif isinstance(o, int):
-            self.fw(self.int_format.format(o))
-        elif isinstance(o, float):
-            self.fw(self.float_format.format(o))
-        elif isinstance(o, (list, tuple)):
-            self._encode_list(o, indent)
-        elif isinstance(o, dict):
-            self._encode_dict(o, indent)
-        elif isinstance(o, Table):
-            int_format = self.int_format
-            float_format = self.float_format
-            self.int_format = '{:5}'
-            self.float_format = '{:12.7f}'
-            self._encode_list(o.items, indent, o.items_per_line)
-            self.int_format = int_format
-            self.float_format = float_format
-        elif isinstance(o, Inline):
-            inline = self.inline
-            self.inline = True
-            self._encode(o.value, indent)
-            self.inline = inline
-        else:
-            self._encode_dict(o.to_json_dict(), indent)
+        if version == self.VERSION:
+            self._entries = entries
 
+    def get(self, key):
+        """Returns the ProcessedMesh stored for the key or None.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._used_entries[key] = entry
+        return ProcessedMesh(*entry)
+
+    def put(self, key, processed_mesh):
+        # Only plain data is stored, so the cache can be read regardless of the add-on's module name.
+        self._used_entries[key] = (processed_mesh.vertices, processed_mesh.parts, processed_mesh.cache_misses)
+
+    def save(self):
+        """Writes all entries used since loading to the cache file.
+        """
+        temp_filepath = self.filepath + '.tmp'
+        with open(temp_filepath, 'wb') as cache_file:
+            pickle.dump((self.VERSION, self._used_entries), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_filepath, self.filepath)
+
+
+class ExtractedMesh:
+    """The result of the extraction stage for one mesh.
+
+    Holds the name of the object from which the mesh has been created, the per-vertex attribute descriptions, the
+    materials of the mesh and either the MeshData for the processing stage or the ProcessedMesh. The bones are the
+    bone references of a skinned mesh, which are shared by all of its parts, or None.
+    """
+    def __init__(self, name, attributes, materials, bones=None):
+        self.name = name
+        self.attributes = attributes
+        self.materials = materials
+        self.bones = bones
+        self.mesh_data = None
+        self.processed_mesh = None
+        self.cache_key = None
 
-class Exporter:
+
+def process_in_pool(process, mesh_datas, num_processes):
+    """Runs process() for all mesh datas in a pool of worker processes.
+
+    The worker processes are forked from Blender, because they could not import this add-on without bpy otherwise.
+    Returns the processed meshes in the order of mesh_datas or None, if the platform cannot fork or the pool fails
+    to start. In this case, the caller has to process the meshes itself.
+    """
+    import concurrent.futures
+    import multiprocessing
+    if multiprocessing.get_start_method() != 'fork':
+        return None
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(num_processes, len(mesh_datas))) as executor:
+            return list(executor.map(process, mesh_datas))
+    except (OSError, concurrent.futures.process.BrokenProcessPool):
+        return None
+
+
+class Exporter(Model):
     def __init__(self, context, source_filepath, dest_filepath, path_mode):
+        super().__init__()
         self.context = context
 
         self.dest_filepath = dest_filepath
@@ -165,22 +385,55 @@ class Exporter:
         self._copy_set = set()  # A set of images which need to be copied. TODO
 
         self._use_cycles = context.scene.render.engine == 'CYCLES'
+        self._geometry_cache = None
+        self._geometry_cache_salt = ''
         self._exported_materials_to_id_map = {}
+        # The set of all material IDs handed out so far and, for every material name, the last counter which has
+        # been appended to it to make an ID unique.
+        self._material_ids = set()
+        self._material_name_counters = {}
+
+        # The time and memory per stage of the export, see run() and format_profile().
+        self.profiler = Profiler()
+        # Statistics about the export, see format_stats().
+        self.stats = OrderedDict([('meshes', 0),
+                                  ('nodes', 0),
+                                  ('split_meshes', 0),
+                                  ('optimized_triangles', 0),
+                                  ('cache_misses_before', 0),
+                                  ('cache_misses_after', 0),
+                                  ('animations', 0),
+                                  ('keyframes', 0),
+                                  ('sampled_keys', 0),
+                                  ('reduced_keys', 0)
+                                  ])
+
+    def format_stats(self):
+        """Returns a one-line summary of the export statistics.
+
+        If the vertex cache has been optimized, the summary includes the average cache miss ratio (ACMR), i.e. the
+        number of simulated vertex cache misses per triangle, before and after the optimization.
+        """
+        summary = 'Exported {} meshes in {} nodes'.format(self.stats['meshes'], self.stats['nodes'])
+        if self.stats['split_meshes']:
+            summary += ', split {} meshes with more than {} vertices'.format(self.stats['split_meshes'],
+                                                                             MAX_MESH_VERTICES)
+        num_triangles = self.stats['optimized_triangles']
+        if num_triangles:
+            summary += ', ACMR {:.3f} -> {:.3f}'.format(self.stats['cache_misses_before'] / num_triangles,
+                                                       self.stats['cache_misses_after'] / num_triangles)
+        if self.stats['animations']:
+            summary += ', {} animations with {} keyframes'.format(self.stats['animations'], self.stats['keyframes'])
+            if self.stats['reduced_keys'] < self.stats['sampled_keys']:
+                summary += ' ({} of {} keys after reduction, {:.1%})'.format(
+                        self.stats['reduced_keys'], self.stats['sampled_keys'],
+                        self.stats['reduced_keys'] / self.stats['sampled_keys'])
+        return summary
 
-        self.version = '0.7'
-        self.id = ''
-        self.meshes = []
-        self.materials = []
-        self.nodes = []
-
-    def to_json_dict(self):
-        dct = OrderedDict()
-        dct['version'] = self.version
-        dct['id'] = self.id
-        dct['meshes'] = self.meshes
-        dct['materials'] = self.materials
-        dct['nodes'] = self.nodes
-        return dct
+    def format_profile(self):
+        """Returns a multi-line report with the time and the memory, which every stage of the export took.
+        """
+        return self.profiler.format_report()
 
     def get_material_id(self, material, textures):
         """Creates a material ID.
@@ -197,10 +450,12 @@ class Exporter:
             if not name:
                 name = 'mat'
             mat_id = name
-            counter = 0
-            while mat_id in self._exported_materials_to_id_map.values():
+            counter = self._material_name_counters.get(name, 0)
+            while mat_id in self._material_ids:
                 counter += 1
                 mat_id = '{}.{}'.format(name, counter)
+            self._material_name_counters[name] = counter
+            self._material_ids.add(mat_id)
             self._exported_materials_to_id_map[key] = mat_id
 
             if self._use_cycles:
@@ -281,20 +536,418 @@ class Exporter:
             mat_desc.popitem('textures')
         self.materials.append(mat_desc)
 
+    @staticmethod
+    def _make_attribute_desc(source, export_normals, export_uv_maps, export_tangents, use_skinning):
+        """Describes the per-vertex attributes of the mesh of the source, see make_attribute_desc().
+
+        Returns a tuple with the list of attribute descriptions, the number of exported UV maps and a flag, which is
+        set if tangents and binormals are exported. They are only exported together with the normals and the UV maps,
+        because a normal map needs both. If use_skinning is set, the bone weights and the bone indices are added.
+        """
+        # Limit the number of UV maps to 8.
+        num_uv_layers = min(8, source.num_uv_layers) if export_uv_maps else 0
+        export_tangents = export_tangents and export_normals and num_uv_layers > 0
+        per_vertex_attribute_desc = make_attribute_desc(export_normals, num_uv_layers, export_tangents, use_skinning)
+        return per_vertex_attribute_desc, num_uv_layers, export_tangents
+
+    def _extract_mesh(self, obj, scene, *,
+                      use_mesh_modifiers,
+                      use_mesh_modifiers_render,
+                      export_normals,
+                      export_uv_maps,
+                      export_tangents,
+                      use_vertex_cache_optimization,
+                      skin=None):
+        """The extraction stage: Converts the geometry of obj to a mesh and reads it into plain arrays.
+
+        The skin is None or the tuple returned by _make_skin(), if the mesh is deformed by an armature.
+
+        Returns an ExtractedMesh or None, if obj has no geometry. With NumPy, the mesh data is left for the
+        processing stage, unless the processed mesh is found in the geometry cache. Without NumPy, the mesh is
+        processed right away.
+        """
+        profiler = self.profiler
+        with profiler.stage('to_mesh', obj.name):
+            try:
+                mesh = obj.to_mesh(scene, use_mesh_modifiers, calc_tessface=False,
+                                   settings='RENDER' if use_mesh_modifiers_render else 'PREVIEW')
+            except RuntimeError:
+                mesh = None
+        if mesh is None:
+            return None
+        profiler.count(obj.name, vertices=len(mesh.vertices), polygons=len(mesh.polygons))
+        source = BlenderMeshSource(obj.name, mesh)
+
+        per_vertex_attribute_desc, num_uv_layers, export_tangents = self._make_attribute_desc(
+            source, export_normals, export_uv_maps, export_tangents, skin is not None)
+        skin_weights = None
+        bones = None
+        if skin is not None:
+            group_bone_indices, bones = skin
+            with profiler.stage('skin_weights', obj.name):
+                skin_weights = read_skin_weights(mesh, group_bone_indices)
+        extracted_mesh = ExtractedMesh(obj.name, per_vertex_attribute_desc, list(mesh.materials) or [None], bones)
+        if np is not None:
+            if self._geometry_cache is not None:
+                with profiler.stage('geometry_cache', obj.name):
+                    # The split normals depend on the smooth flags of the faces and on the custom normals, so they
+                    # are part of the hash. The tangents are derived from the hashed data.
+                    if export_normals:
+                        mesh.calc_normals_split()
+                    extracted_mesh.cache_key = hash_mesh_data(
+                        source.read_mesh_data(export_normals, num_uv_layers, skin_weights=skin_weights),
+                        self._geometry_cache_salt)
+                    extracted_mesh.processed_mesh = self._geometry_cache.get(extracted_mesh.cache_key)
+            if extracted_mesh.processed_mesh is None:
+                with profiler.stage('triangulate', obj.name):
+                    source.prepare(export_normals, export_tangents)
+                with profiler.stage('read_mesh', obj.name):
+                    extracted_mesh.mesh_data = source.read_mesh_data(export_normals, num_uv_layers, export_tangents,
+                                                                     skin_weights)
+        else:
+            with profiler.stage('triangulate', obj.name):
+                prepare_mesh(mesh, export_normals, export_tangents)
+            with profiler.stage('process', obj.name):
+                extracted_mesh.processed_mesh = process_mesh_per_loop(mesh, export_normals, num_uv_layers,
+                                                                      export_tangents, skin_weights)
+            if use_vertex_cache_optimization:
+                with profiler.stage('optimize_vertex_cache', obj.name):
+                    optimize_parts(extracted_mesh.processed_mesh, optimize_vertex_cache)
+                    reorder_vertex_list_by_first_use(extracted_mesh.processed_mesh,
+                                                     sum(pva['size'] for pva in per_vertex_attribute_desc))
+
+        # Delete the recently created mesh.
+        bpy.data.meshes.remove(mesh)
+        return extracted_mesh
+
+    def _process_meshes(self, extracted_meshes, num_processes, use_vertex_cache_optimization):
+        """The processing stage: Partitions and deduplicates all extracted meshes, which have not been processed yet.
+
+        If num_processes is not 1, the meshes are distributed over a pool of num_processes worker processes (0 means
+        one per CPU core). The results are assigned in the order of the extracted meshes.
+        """
+        pending_meshes = [extracted_mesh for extracted_mesh in extracted_meshes
+                          if extracted_mesh.processed_mesh is None]
+        if not pending_meshes:
+            return
+        mesh_datas = [extracted_mesh.mesh_data for extracted_mesh in pending_meshes]
+        process = partial(process_mesh_data, use_vertex_cache_optimization=use_vertex_cache_optimization)
+        processed_meshes = None
+        use_pool = num_processes != 1 and len(mesh_datas) > 1
+        # The forked workers would inherit the memory tracing, which slows them down.
+        with self.profiler.stage('process', trace_memory=not use_pool):
+            if use_pool:
+                processed_meshes = process_in_pool(process, mesh_datas, num_processes or os.cpu_count() or 1)
+            if processed_meshes is None:
+                processed_meshes = list(map(process, mesh_datas))
+
+        for extracted_mesh, processed_mesh in zip(pending_meshes, processed_meshes):
+            extracted_mesh.processed_mesh = processed_mesh
+            extracted_mesh.mesh_data = None
+            # The steps may have run in a worker process, so their memory is unknown.
+            for step, seconds in processed_mesh.timings.items():
+                self.profiler.add_time(step, seconds, extracted_mesh.name)
+            if self._geometry_cache is not None:
+                self._geometry_cache.put(extracted_mesh.cache_key, processed_mesh)
+
+    def _stream_mesh(self, extracted_mesh, writer, attribute_precisions, use_vertex_cache_optimization):
+        """Processes and adds the mesh right away and passes the resulting meshes on to the streaming writer.
+
+        The meshes are removed from the exporter afterwards, so they can be freed. Returns the list of part
+        references for the nodes, which use the mesh.
+        """
+        self._process_meshes([extracted_mesh], 1, use_vertex_cache_optimization)
+        with self.profiler.stage('merge', extracted_mesh.name):
+            mesh_parts_ref = self._add_mesh(extracted_mesh, attribute_precisions)
+        extracted_mesh.processed_mesh = None
+        with self.profiler.stage('write', extracted_mesh.name):
+            for mesh in self.meshes:
+                writer.write_stream_item(mesh)
+        del self.meshes[:]
+        return mesh_parts_ref
+
+    def _add_mesh(self, extracted_mesh, attribute_precisions):
+        """The merge stage: Adds a processed mesh to the exported meshes and registers its materials.
+
+        A mesh with more vertices than 16-bit indices can address is split into several meshes. Returns the list of
+        part references for the nodes, which use the mesh.
+        """
+        processed_mesh = extracted_mesh.processed_mesh
+        per_vertex_attribute_desc = extracted_mesh.attributes
+        stride = sum([pva['size'] for pva in per_vertex_attribute_desc])
+
+        num_triangles = sum(len(indices) for _, indices, _ in processed_mesh.parts) // 3
+        self.profiler.count(extracted_mesh.name, triangles=num_triangles,
+                            unique_vertices=len(processed_mesh.vertices) // (1 if np is not None else stride))
+        if processed_mesh.cache_misses is not None:
+            self.stats['optimized_triangles'] += num_triangles
+            self.stats['cache_misses_before'] += processed_mesh.cache_misses[0]
+            self.stats['cache_misses_after'] += processed_mesh.cache_misses[1]
+
+        meshes, part_keys = build_meshes(extracted_mesh.name, per_vertex_attribute_desc, processed_mesh,
+                                         attribute_precisions)
+        if len(meshes) > 1:
+            self.stats['split_meshes'] += 1
+
+        local_parts_ref = []
+        for mesh_part_id, (material_index, image_names) in part_keys:
+            images = [bpy.data.images.get(name) if name is not None else None for name in image_names]
+            material_id = self.get_material_id(extracted_mesh.materials[material_index], images)
+            part_ref = OrderedDict([('meshpartid', mesh_part_id),
+                                    ('materialid', material_id)])
+            if extracted_mesh.bones is not None:
+                # The bone indices of the vertices refer to this list, so all parts share it.
+                part_ref['bones'] = extracted_mesh.bones
+            part_ref['uvMapping'] = Inline([[0]])  # TODO
+            local_parts_ref.append(part_ref)
+        self.meshes.extend(meshes)
+        self.stats['meshes'] += len(meshes)
+        return local_parts_ref
+
+    @staticmethod
+    def _get_bone_rest_matrix(bone, armature_obj, global_matrix):
+        """Returns the rest transform of the bone relative to its parent bone.
+
+        The transform of a root bone includes the transform of the armature object and the global matrix, because
+        the bones of a skeleton are placed relative to the model.
+        """
+        if bone.parent is None:
+            return global_matrix * armature_obj.matrix_world * bone.matrix_local
+        return bone.parent.matrix_local.inverted() * bone.matrix_local
+
+    def _make_skin(self, obj, armature_obj, global_matrix):
+        """Binds the mesh of obj to the deforming bones of armature_obj.
+
+        Returns a tuple (group_bone_indices, bones) or None, if no vertex group of obj belongs to a deforming bone.
+        The group_bone_indices are passed on to read_skin_weights() and the bones are the bone references of the
+        mesh parts. The transform of a bone reference is the inverse bind pose, which maps the vertices of the mesh
+        into the space of the bone. The node of a skinned mesh has the identity transform, because its vertices are
+        placed by the bones.
+        """
+        group_names = set(group.name for group in obj.vertex_groups)
+        deform_bones = [bone for bone in armature_obj.data.bones if bone.use_deform and bone.name in group_names]
+        if not deform_bones:
+            return None
+        bone_indices = {bone.name: bone_idx for bone_idx, bone in enumerate(deform_bones)}
+        group_bone_indices = [bone_indices.get(group.name) for group in obj.vertex_groups]
+
+        mesh_matrix = global_matrix * obj.matrix_world
+        bones = []
+        for bone in deform_bones:
+            bind_matrix = global_matrix * armature_obj.matrix_world * bone.matrix_local
+            inverse_bind_matrix = bind_matrix.inverted() * mesh_matrix
+            bones.append(OrderedDict([('node', bone.name),
+                                      ('transform', Table([col for row in inverse_bind_matrix.transposed()
+                                                           for col in row], 4))
+                                      ]))
+        return group_bone_indices, bones
+
+    def _make_bone_node(self, bone, armature_obj, global_matrix):
+        """Creates the skeleton node of the bone and, recursively, of its child bones.
+        """
+        transform = self._get_bone_rest_matrix(bone, armature_obj, global_matrix)
+        node = OrderedDict([('id', bone.name),
+                            ('skeleton', True),
+                            ('transform', Table([col for row in transform.transposed() for col in row], 4))
+                            ])
+        if bone.children:
+            node['children'] = [self._make_bone_node(child, armature_obj, global_matrix) for child in bone.children]
+        return node
+
+    @staticmethod
+    def _sample_pose_bone(pose_bone, channels, frames):
+        """Evaluates the F-curves of the pose bone at the frames.
+
+        The channels map the name of an animated property to a dict from the array index to the F-curve. Properties
+        without an F-curve keep the current value of the pose bone. Returns a list with the basis matrix (the
+        transform relative to the rest pose) per frame.
+        """
+        def sample(prop):
+            curves = channels.get(prop, {})
+            default = getattr(pose_bone, prop)
+            columns = [[curves[idx].evaluate(frame) for frame in frames] if idx in curves
+                       else [default[idx]] * len(frames)
+                       for idx in range(len(default))]
+            return list(zip(*columns))
+
+        rotation_mode = pose_bone.rotation_mode
+        if rotation_mode == 'QUATERNION':
+            rotations = [Quaternion(values) for values in sample('rotation_quaternion')]
+        elif rotation_mode == 'AXIS_ANGLE':
+            rotations = [Quaternion(values[1:], values[0]) for values in sample('rotation_axis_angle')]
+        else:
+            rotations = [Euler(values, rotation_mode).to_quaternion() for values in sample('rotation_euler')]
+
+        basis_matrices = []
+        for location, rotation, scale in zip(sample('location'), rotations, sample('scale')):
+            scale_matrix = Matrix.Identity(4)
+            for axis in range(3):
+                scale_matrix[axis][axis] = scale[axis]
+            basis_matrices.append(Matrix.Translation(location) * rotation.to_matrix().to_4x4() * scale_matrix)
+        return basis_matrices
+
+    def _export_animations(self, armature_objects, scene, global_matrix, keyframe_tolerance=0.0):
+        """Exports the actions, which animate bones of the armature_objects, as animations.
+
+        The keyframes are sampled at every frame of an action by evaluating its F-curves directly, which is much
+        faster than setting the frame of the scene, because this evaluates all objects. Constraints and drivers are
+        not taken into account. Every keyframe holds the transform of the bone relative to its parent. The key
+        times are normalized to [0, 1], as Cocos2d-x scales them by the length of the animation.
+
+        The rotation, scale and translation of every bone are reduced separately, see reduce_keys(). A key is
+        dropped, if it can be interpolated from its neighbours with an error of at most keyframe_tolerance.
+        """
+        fps = scene.render.fps / scene.render.fps_base
+        for action in bpy.data.actions:
+            # Group the F-curves by the bone and the property, which they animate.
+            bone_channels = {}
+            for fcurve in action.fcurves:
+                match = POSE_BONE_DATA_PATH.match(fcurve.data_path)
+                if match is not None:
+                    bone_name = match.group(1).replace('\\"', '"').replace('\\\\', '\\')
+                    channels = bone_channels.setdefault(bone_name, {})
+                    channels.setdefault(match.group(2), {})[fcurve.array_index] = fcurve
+            if not bone_channels:
+                continue
+
+            frame_start, frame_end = action.frame_range
+            duration = frame_end - frame_start
+            frames = [min(frame_start + frame, frame_end) for frame in range(int(math.ceil(duration)) + 1)]
+            keytimes = [(frame - frame_start) / duration if duration > 0 else 0.0 for frame in frames]
+
+            bones = []
+            for armature_obj in armature_objects:
+                for pose_bone in armature_obj.pose.bones:
+                    channels = bone_channels.get(pose_bone.name)
+                    if channels is None:
+                        continue
+                    rest_matrix = self._get_bone_rest_matrix(pose_bone.bone, armature_obj, global_matrix)
+                    rotations, scales, translations = [], [], []
+                    for basis_matrix in self._sample_pose_bone(pose_bone, channels, frames):
+                        translation, rotation, scale = (rest_matrix * basis_matrix).decompose()
+                        # Keep the quaternions in the same hemisphere, so they are interpolated along the short arc.
+                        if rotations and rotation.dot(rotations[-1]) < 0:
+                            rotation = -rotation
+                        rotations.append(rotation)
+                        scales.append(tuple(scale))
+                        translations.append(tuple(translation))
+                    rotations = [(rotation.x, rotation.y, rotation.z, rotation.w) for rotation in rotations]
+
+                    # Reduce every channel on its own. A keyframe holds the channels, which have a key at its time.
+                    keyframes = OrderedDict((frame_idx, OrderedDict([('keytime', keytime)]))
+                                            for frame_idx, keytime in enumerate(keytimes))
+                    for key, values, interpolate in (('rotation', rotations, slerp),
+                                                     ('scale', scales, lerp),
+                                                     ('translation', translations, lerp)):
+                        kept = reduce_keys(keytimes, values, keyframe_tolerance, interpolate)
+                        for frame_idx in kept:
+                            keyframes[frame_idx][key] = Inline(list(values[frame_idx]))
+                        self.stats['sampled_keys'] += len(values)
+                        self.stats['reduced_keys'] += len(kept)
+                    keyframes = [keyframe for keyframe in keyframes.values() if len(keyframe) > 1]
+                    bones.append(OrderedDict([('boneId', pose_bone.name),
+                                              ('keyframes', keyframes)
+                                              ]))
+                    self.stats['keyframes'] += len(keyframes)
+            if not bones:
+                continue
+
+            self.animations.append(OrderedDict([('id', action.name),
+                                                ('length', duration / fps),
+                                                ('bones', bones)
+                                                ]))
+            self.stats['animations'] += 1
+
+    @staticmethod
+    def _get_geometry_key(obj, use_mesh_modifiers):
+        """Returns a key, which is equal for objects with the same evaluated geometry.
+
+        This is the case for objects which share their data (e.g. linked duplicates), have identical modifier stacks
+        and the same materials. Returns None, if the geometry of obj must not be shared. This is the case if a
+        modifier references another object, because the result of the modifier depends on the relative placement.
+        """
+        if obj.data is None:
+            return None
+        modifier_keys = []
+        if use_mesh_modifiers:
+            for modifier in obj.modifiers:
+                settings = []
+                for prop in modifier.bl_rna.properties:
+                    if prop.identifier in ('rna_type', 'name'):
+                        continue
+                    value = getattr(modifier, prop.identifier)
+                    if prop.type == 'POINTER':
+                        if value is not None and (not isinstance(value, bpy.types.ID)
+                                                  or isinstance(value, bpy.types.Object)):
+                            return None
+                    elif prop.type == 'COLLECTION':
+                        return None
+                    elif getattr(prop, 'is_array', False):
+                        value = tuple(value)
+                    elif isinstance(value, set):
+                        value = frozenset(value)
+                    settings.append((prop.identifier, value))
+                modifier_keys.append((modifier.type, tuple(settings)))
+        materials = tuple(slot.material for slot in obj.material_slots)
+        return obj.data, tuple(modifier_keys), materials
+
     def run(self, context,
             *,
             global_matrix=None,
+            file_format='C3T',
             use_selection,
             export_normals,
             export_uv_maps,
+            export_tangents=False,
+            export_animations=True,
             export_animations_only=False,
+            keyframe_tolerance=0.0001,
             use_mesh_modifiers,
-            use_mesh_modifiers_render):
+            use_mesh_modifiers_render,
+            use_geometry_cache=False,
+            num_processes=0,
+            use_vertex_cache_optimization=False,
+            use_compact_output=False,
+            use_streaming_output=False,
+            use_profiling=False,
+            write_profile=False,
+            trace_memory=False,
+            position_precision=5,
+            normal_precision=4,
+            uv_precision=4):
         """Exports a scene in the Cocos2d-x format.
 
         :param global_matrix: The matrix applied to the transform of the nodes. Useful for rotating the coordinate frame
             and applying a global scale.
+        :param file_format: Either 'C3T' for the JSON text format or 'C3B' for the binary format.
+        :param export_tangents: If set, the tangents and the binormals of the first UV map are exported for meshes
+            with normals and UV maps.
+        :param export_animations: If set, the actions, which animate the bones of the exported armatures, are
+            exported as animations. The armatures and the skinned meshes are exported regardless of this flag.
+        :param export_animations_only: If set, only the animations are exported. The meshes, materials and nodes
+            are skipped, so no mesh data is read at all.
+        :param keyframe_tolerance: The maximum error of a component of a rotation, scale or translation, with which
+            a sampled key is dropped, because it can be interpolated from the remaining keys. 0 keeps all keys.
+        :param use_geometry_cache: If set, the processed geometry is stored in a cache file next to the exported file
+            and reused for objects, which have not changed since the last export.
+        :param num_processes: The number of worker processes, which partition and deduplicate the meshes. 0 uses one
+            process per CPU core.
+        :param use_vertex_cache_optimization: If set, the triangles of every mesh part are reordered to reduce the
+            misses of the GPU's post-transform vertex cache and the vertices are reordered to match the order in
+            which the triangles use them.
+        :param use_compact_output: If set, the c3t file is written without whitespace and the vertex attributes are
+            rounded to position_precision, normal_precision and uv_precision decimal places.
+        :param use_streaming_output: If set, every mesh is processed and written to the file right after it has been
+            read and is freed afterwards. This bounds the memory usage by the largest mesh rather than by the whole
+            scene. The meshes are not processed in worker processes in this mode.
+        :param use_profiling: If set, the time of every stage of the export is measured, see format_profile().
+        :param write_profile: If set, the profile is measured and written as JSON to a file next to the exported
+            file (the file name with an additional '.profile.json' extension).
+        :param trace_memory: If set, the profile includes the peak memory of every stage. Tracing the memory slows
+            down the Python code of the exporter much more than Blender's code, so the times are distorted.
         """
+        self.profiler = Profiler(enabled=use_profiling or write_profile, trace_memory=trace_memory)
+        self.profiler.start()
 
         # Life is much easier if there is always a global matrix. Fall back to the identity matrix.
         if global_matrix is None:
@@ -302,6 +955,19 @@ class Exporter:
 
         scene = context.scene
 
+        # The number of decimal places per vertex attribute in compact output.
+        attribute_precisions = make_attribute_precisions(position_precision, normal_precision, uv_precision)
+
+        # The cache entries are keyed by the mesh data (see hash_mesh_data()) salted with the export options and the
+        # global matrix.
+        if use_geometry_cache and np is not None and not export_animations_only:
+            self._geometry_cache = GeometryCache(self.dest_filepath + '.cache')
+            with self.profiler.stage('load_cache'):
+                self._geometry_cache.load()
+            self._geometry_cache_salt = repr((export_normals, export_uv_maps, export_tangents,
+                                              use_vertex_cache_optimization,
+                                              [list(row) for row in global_matrix]))
+
         # Enter object mode.
         if bpy.ops.object.mode_set.poll():
             bpy.ops.object.mode_set(mode='OBJECT')
@@ -313,130 +979,136 @@ class Exporter:
         else:
             objects_to_export = scene.objects
 
-        export_model = True
-        if export_model:
-            for obj_idx, obj in enumerate(objects_to_export):
+        # The armatures are exported as skeletons. The meshes, which they deform, are read in the rest pose.
+        armature_objects = [obj for obj in objects_to_export if obj.type == 'ARMATURE']
+        pose_positions = [armature_obj.data.pose_position for armature_obj in armature_objects]
+
+        # The animations depend on the armatures only. They are exported first, so the sections of a streamed c3b
+        # file are known from the start.
+        if export_animations or export_animations_only:
+            with self.profiler.stage('animations'):
+                self._export_animations(armature_objects, scene, global_matrix, keyframe_tolerance)
+        self.animations_only = export_animations_only
+
+        if file_format == 'C3B':
+            writer = BinaryWriter()
+            file_mode = 'wb'
+        else:
+            writer = JsonWriter(compact=use_compact_output)
+            file_mode = 'wt'
+
+        # Objects with the same geometry (e.g. linked duplicates) share a single exported mesh. This maps the
+        # geometry key of such objects to the index of their mesh in mesh_parts_refs.
+        geometry_key_to_mesh_index_map = {}
+        extracted_meshes = []
+        mesh_parts_refs = []
+        # The exported objects, the index of their mesh and a flag, which is set if the mesh is skinned.
+        node_objects = []
+
+        # When streaming, the file is written while the meshes are read.
+        stream_file = None
+        if use_streaming_output and not export_animations_only:
+            stream_file = open(self.dest_filepath, file_mode)
+        try:
+            if stream_file is not None:
+                with self.profiler.stage('write'):
+                    writer.begin_stream(self, 'meshes', stream_file)
+
+            if not export_animations_only:
                 try:
-                    mesh = obj.to_mesh(scene, use_mesh_modifiers, calc_tessface=False,
-                                       settings='RENDER' if use_mesh_modifiers_render else 'PREVIEW')
-                except RuntimeError:
-                    mesh = None
-                if mesh is None:
-                    continue
-
-                triangulate_mesh(mesh)
-                if export_normals:
-                    mesh.calc_normals_split()
-
-                # The position is always included in the per-vertex attributes.
-                per_vertex_attribute_desc = [OrderedDict([('attribute', 'VERTEX_ATTRIB_POSITION'),
-                                                          ('size', 3),
-                                                          ('type', "GL_FLOAT")
-                                                          ])]
-                # Add the normal vectors to the per-vertex attributes.
-                if export_normals:
-                    per_vertex_attribute_desc.append(
-                            OrderedDict([("attribute", 'VERTEX_ATTRIB_NORMAL'),
-                                         ('size', 3),
-                                         ('type', 'GL_FLOAT')
-                                         ]))
-                # Add the texture coordinates to the per-vertex attributes.
-                num_uv_layers = 0
-                if export_uv_maps:
-                    # Limit the number of UV maps to 8.
-                    num_uv_layers = min(8, len(mesh.uv_layers), len(mesh.uv_textures))
-                    for idx in range(num_uv_layers):
-                        attribute_name = 'VERTEX_ATTRIB_TEX_COORD{}'.format(idx if idx else "")
-                        per_vertex_attribute_desc.append(
-                                OrderedDict([('attribute', attribute_name),
-                                             ('size', 2),
-                                             ('type', 'GL_FLOAT')
-                                             ]))
-
-                # Polygons with different (material, textures)-combinations belong to
-                # different parts of the mesh. Assign all polygons with the same (material, textures)-tuple
-                # to one set. We do this through a dict, where the (material, textures)-tuple is
-                # used as key.
-                materials = mesh.materials
-                if not materials:
-                    materials = [None]
-                part_to_polygons_map = OrderedDict()
-                for poly in mesh.polygons:
-                    local_textures = [uv.data[poly.index].image for uv in mesh.uv_textures[:num_uv_layers]]
-                    material_id = self.get_material_id(materials[poly.material_index], local_textures)
-                    if material_id not in part_to_polygons_map:
-                        part_to_polygons_map[material_id] = []
-                    part_to_polygons_map[material_id].append(poly)
-
-                # A mapping from vertex attributes to an integer index. Used to uniquify vertex data.
-                vertex_attributes_to_index_map = {}
-                num_unique_vertices = 0
-                vertex_attributes = []
-                local_parts = []
-                local_parts_ref = []
-                for part_idx, (material_id, polygons) in enumerate(part_to_polygons_map.items()):
-                    # The ID of this mesh part.
-                    mesh_part_id = '{}_part{}'.format(obj.name, part_idx + 1)
-                    # A list of vertex indices which make up a polygon.
-                    polygon_vertex_indices = []
-                    aabb_min = [inf, inf, inf]
-                    aabb_max = [-inf, -inf, -inf]
-                    for poly in polygons:
-                        for vertex_idx, loop in zip(poly.vertices, poly.loop_indices):
-                            # Collect all vertex attributes (position, normal vector, uv-coordinates...) in an array.
-                            local_vertex_attributes = list(mesh.vertices[vertex_idx].co)
-                            if export_normals:
-                                local_vertex_attributes.extend(mesh.vertices[vertex_idx].normal)
-                            for uv_idx in range(num_uv_layers):
-                                uv_coord = mesh.uv_layers[uv_idx].data[loop].uv
-                                local_vertex_attributes.extend([uv_coord[0], 1 - uv_coord[1]])
-                            # Avoid storing duplicated vertex attributes.
-                            vertex_key = tuple(local_vertex_attributes)
-                            unique_idx = vertex_attributes_to_index_map.get(vertex_key)
-                            if unique_idx is None:
-                                unique_idx = vertex_attributes_to_index_map[vertex_key] = num_unique_vertices
-                                num_unique_vertices += 1
-                                vertex_attributes.extend(local_vertex_attributes)
-                                # Update the bounding box.
-                                for coord in range(3):
-                                    aabb_min[coord] = min(aabb_min[coord], local_vertex_attributes[coord])
-                                    aabb_max[coord] = max(aabb_max[coord], local_vertex_attributes[coord])
-
-                            polygon_vertex_indices.append(unique_idx)
-
-                    local_parts.append(OrderedDict([('id', mesh_part_id),
-                                                    ('type', 'TRIANGLES'),
-                                                    ('indices', Table(polygon_vertex_indices, 3)),
-                                                    ('aabb', Table(aabb_min + aabb_max, 3))
-                                                    ]))
-                    local_parts_ref.append(OrderedDict([('meshpartid', mesh_part_id),
-                                                        ('materialid', material_id),
-                                                        ('uvMapping', Inline([[0]]))  # TODO
-                                                        ]))
-
-                # Apply the global matrix to the object's transform matrix (which could flip the coordinate system
-                # or scale the instance, for example).
-                transform = global_matrix * obj.matrix_world
-
-                vertex_attributes = Table(vertex_attributes)
-                vertex_attributes.items_per_line = sum([pva['size'] for pva in per_vertex_attribute_desc])
-                self.meshes.append(OrderedDict([('attributes', per_vertex_attribute_desc),
-                                                ('vertices', vertex_attributes),
-                                                ('parts', local_parts)
-                                                ]))
-                self.nodes.append(OrderedDict([('id', obj.name),
-                                               ('skeleton', False),
-                                               ('transform', Table([col for row in transform.transposed()
-                                                                    for col in row], 4)),
-                                               ('parts', local_parts_ref)
-                                               ]))
-                # Delete the recently created mesh.
-                bpy.data.meshes.remove(mesh)
-
-        # Finally write the file.
-        with open(self.dest_filepath, 'wt') as out_file:
-            writer = JsonWriter()
-            writer.write(self, out_file.write)
+                    for armature_obj in armature_objects:
+                        armature_obj.data.pose_position = 'REST'
+                    if armature_objects:
+                        scene.update()
+
+                    # Read the meshes on the main thread, which is the only one allowed to access Blender's data.
+                    for obj_idx, obj in enumerate(objects_to_export):
+                        if obj.type == 'ARMATURE':
+                            continue
+                        armature_obj = obj.find_armature()
+                        skin = None
+                        if armature_obj in armature_objects:
+                            skin = self._make_skin(obj, armature_obj, global_matrix)
+                        # The bind pose is part of the skin, so skinned meshes are not shared.
+                        geometry_key = self._get_geometry_key(obj, use_mesh_modifiers) if skin is None else None
+                        mesh_idx = geometry_key_to_mesh_index_map.get(geometry_key)
+                        if mesh_idx is None:
+                            extracted_mesh = self._extract_mesh(
+                                obj, scene,
+                                use_mesh_modifiers=use_mesh_modifiers,
+                                use_mesh_modifiers_render=use_mesh_modifiers_render,
+                                export_normals=export_normals,
+                                export_uv_maps=export_uv_maps,
+                                export_tangents=export_tangents,
+                                use_vertex_cache_optimization=use_vertex_cache_optimization,
+                                skin=skin)
+                            if extracted_mesh is None:
+                                continue
+                            if stream_file is not None:
+                                mesh_idx = len(mesh_parts_refs)
+                                mesh_parts_refs.append(self._stream_mesh(extracted_mesh, writer, attribute_precisions,
+                                                                         use_vertex_cache_optimization))
+                            else:
+                                mesh_idx = len(extracted_meshes)
+                                extracted_meshes.append(extracted_mesh)
+                            if geometry_key is not None:
+                                geometry_key_to_mesh_index_map[geometry_key] = mesh_idx
+                        node_objects.append((obj, mesh_idx, skin is not None))
+                finally:
+                    for armature_obj, pose_position in zip(armature_objects, pose_positions):
+                        armature_obj.data.pose_position = pose_position
+                    if armature_objects:
+                        scene.update()
+
+                if stream_file is None:
+                    self._process_meshes(extracted_meshes, num_processes, use_vertex_cache_optimization)
+
+                    # Merge the results in the original order of the objects. The processed meshes are freed as
+                    # soon as they have been copied into the exported meshes.
+                    with self.profiler.stage('merge'):
+                        for extracted_mesh in extracted_meshes:
+                            mesh_parts_refs.append(self._add_mesh(extracted_mesh, attribute_precisions))
+                            extracted_mesh.processed_mesh = None
+                for obj, mesh_idx, is_skinned in node_objects:
+                    # Apply the global matrix to the object's transform matrix (which could flip the coordinate
+                    # system or scale the instance, for example). The vertices of a skinned mesh are placed by its
+                    # bones.
+                    transform = Matrix() if is_skinned else global_matrix * obj.matrix_world
+
+                    self.nodes.append(OrderedDict([('id', obj.name),
+                                                   ('skeleton', False),
+                                                   ('transform', Table([col for row in transform.transposed()
+                                                                        for col in row], 4)),
+                                                   ('parts', mesh_parts_refs[mesh_idx])
+                                                   ]))
+                    self.stats['nodes'] += 1
+
+                # Add the bone hierarchy of every armature.
+                for armature_obj in armature_objects:
+                    for bone in armature_obj.data.bones:
+                        if bone.parent is None:
+                            self.nodes.append(self._make_bone_node(bone, armature_obj, global_matrix))
+                            self.stats['nodes'] += 1
+
+            # Finally write the file.
+            with self.profiler.stage('write'):
+                if stream_file is not None:
+                    writer.end_stream(self)
+                else:
+                    with open(self.dest_filepath, file_mode) as out_file:
+                        writer.write(self, out_file.write)
+        finally:
+            if stream_file is not None:
+                stream_file.close()
+
+        if self._geometry_cache is not None:
+            with self.profiler.stage('save_cache'):
+                self._geometry_cache.save()
 
         # Copy all textures which have been collected in the copy-set.
-        bpy_extras.io_utils.path_reference_copy(self._copy_set)
+        with self.profiler.stage('copy_textures'):
+            bpy_extras.io_utils.path_reference_copy(self._copy_set)
+
+        self.profiler.stop()
+        if write_profile:
+            self.profiler.save(self.dest_filepath + '.profile.json')
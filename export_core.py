@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# ====---------------------------------------------------------------------====
+#     This is a Blender addon for exporting a scene to Cocos2d-x in
+#     its JSON file format (c3t).
+#     Created by Manuel Freiberger.
+#
+#     This module holds the part of the mesh export, which does not depend
+#     on Blender: the interface to the source of a mesh, the merge stage and
+#     a pipeline, which runs all stages for a list of mesh sources. It must
+#     not import bpy. Besides as a part of the add-on, it can be imported as
+#     a top-level module by adding the add-on's directory to sys.path, e.g.
+#     to benchmark the export with FakeMeshSource in plain Python.
+# ====---------------------------------------------------------------------====
+
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+if __package__:
+    from .mesh_processing import MeshData, process_mesh_data, split_mesh, split_mesh_list
+    from .profiling import Profiler
+    from .writers import ArrayTable, BinaryWriter, Inline, JsonWriter, Table
+else:
+    from mesh_processing import MeshData, process_mesh_data, split_mesh, split_mesh_list
+    from profiling import Profiler
+    from writers import ArrayTable, BinaryWriter, Inline, JsonWriter, Table
+
+
+# The maximum number of bones, which influence a vertex. This is the size of the blend weight and blend index
+# attributes, which Cocos2d-x's skinning shaders expect.
+MAX_BONE_INFLUENCES = 4
+
+
+class MeshSource:
+    """The interface, through which the export reads the geometry of an object.
+
+    A mesh source has the name of the object and the number of its UV maps. prepare() is called once before the
+    mesh data is read for the processing stage, e.g. to triangulate the mesh. read_mesh_data() returns the
+    triangulated mesh as a MeshData, whose loop attributes are laid out as described by make_attribute_desc().
+    The skin_weights are None or hold a row with the bone weights and bone indices of every vertex.
+
+    The add-on reads Blender meshes with BlenderMeshSource, FakeMeshSource serves plain arrays instead.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    @property
+    def num_uv_layers(self):
+        raise NotImplementedError
+
+    def prepare(self, export_normals, export_tangents):
+        pass
+
+    def read_mesh_data(self, export_normals, num_uv_layers, export_tangents=False, skin_weights=None):
+        raise NotImplementedError
+
+
+class FakeMeshSource(MeshSource):
+    """A mesh source, which serves a triangle mesh from NumPy arrays, so the export can run without Blender.
+
+    The positions and the normals hold a row per vertex and the triangles hold the three vertex indices of every
+    triangle. The uv_layers are a list with a row of UV coordinates per vertex for every UV map. The
+    material_indices hold the material slot of every triangle (all 0 if None) and the material_names the name of
+    the material in every slot. The fake source has no tangents and no images.
+    """
+    def __init__(self, name, positions, triangles, normals=None, uv_layers=(), material_indices=None,
+                 material_names=None):
+        super().__init__(name)
+        self.positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        self.triangles = np.asarray(triangles, dtype=np.int32).reshape(-1, 3)
+        self.normals = None if normals is None else np.asarray(normals, dtype=np.float32).reshape(-1, 3)
+        self.uv_layers = [np.asarray(uvs, dtype=np.float32).reshape(-1, 2) for uvs in uv_layers]
+        if material_indices is None:
+            material_indices = np.zeros(len(self.triangles), dtype=np.int32)
+        self.material_indices = np.asarray(material_indices, dtype=np.int32)
+        self.material_names = list(material_names or [None])
+
+    @classmethod
+    def grid(cls, name, size, num_materials=1):
+        """Creates a flat grid of size x size quads in the xy-plane with normals and one UV map.
+
+        The grid has (size + 1)² vertices and 2·size² triangles. Its rows of quads are distributed evenly over
+        num_materials material slots. A size above 255 gives more vertices than a single Cocos2d-x mesh can have.
+        """
+        coords = np.linspace(0.0, 1.0, size + 1, dtype=np.float32)
+        x, y = np.meshgrid(coords, coords)
+        positions = np.column_stack([x.ravel(), y.ravel(), np.zeros(x.size, dtype=np.float32)])
+        normals = np.tile(np.array([0.0, 0.0, 1.0], dtype=np.float32), (len(positions), 1))
+        # The index of the lower left vertex of every quad.
+        corners = (np.arange(size)[:, np.newaxis] * (size + 1) + np.arange(size)).ravel()
+        triangles = np.column_stack([corners, corners + 1, corners + size + 2,
+                                     corners, corners + size + 2, corners + size + 1])
+        material_indices = np.repeat(np.arange(size) * num_materials // size, 2 * size)
+        return cls(name, positions, triangles, normals, [positions[:, :2]], material_indices,
+                   ['Material{}'.format(idx) for idx in range(num_materials)])
+
+    @property
+    def num_uv_layers(self):
+        return len(self.uv_layers)
+
+    def read_mesh_data(self, export_normals, num_uv_layers, export_tangents=False, skin_weights=None):
+        if export_tangents:
+            raise ValueError('{} has no tangents'.format(self.name))
+        if export_normals and self.normals is None:
+            raise ValueError('{} has no normals'.format(self.name))
+        loop_vertex_indices = self.triangles.ravel()
+        columns = [self.positions[loop_vertex_indices]]
+        if export_normals:
+            columns.append(self.normals[loop_vertex_indices])
+        for uvs in self.uv_layers[:num_uv_layers]:
+            # Flip the v coordinate like the Blender reader does.
+            uvs = uvs[loop_vertex_indices]
+            uvs[:, 1] = 1 - uvs[:, 1]
+            columns.append(uvs)
+        if skin_weights is not None:
+            columns.append(np.array(skin_weights, dtype=np.float32).reshape(-1, 2 * MAX_BONE_INFLUENCES)
+                           [loop_vertex_indices])
+        num_triangles = len(self.triangles)
+        return MeshData(np.hstack(columns),
+                        self.material_indices,
+                        np.arange(0, 3 * num_triangles, 3, dtype=np.int32),
+                        np.full(num_triangles, 3, dtype=np.int32),
+                        self.material_names,
+                        [[None] * num_triangles for _ in range(min(num_uv_layers, self.num_uv_layers))])
+
+
+class Model:
+    """The content of an exported file, which the writers serialize via to_json_dict().
+
+    If animations_only is set, the file holds the animations only.
+    """
+    def __init__(self):
+        self.version = '0.7'
+        self.id = ''
+        self.meshes = []
+        self.materials = []
+        self.nodes = []
+        self.animations = []
+        self.animations_only = False
+
+    def to_json_dict(self):
+        dct = OrderedDict()
+        dct['version'] = self.version
+        dct['id'] = self.id
+        if not self.animations_only:
+            dct['meshes'] = self.meshes
+            dct['materials'] = self.materials
+            dct['nodes'] = self.nodes
+        if self.animations:
+            dct['animations'] = self.animations
+        return dct
+
+
+def make_attribute_desc(export_normals, num_uv_layers, export_tangents, use_skinning):
+    """Describes the per-vertex attributes in the order, in which MeshSource.read_mesh_data() lays them out.
+
+    The position is always included. The normal, the coordinates of num_uv_layers UV maps, the tangent and the
+    binormal and, if use_skinning is set, the bone weights and bone indices follow as requested.
+    """
+    per_vertex_attribute_desc = [OrderedDict([('attribute', 'VERTEX_ATTRIB_POSITION'),
+                                              ('size', 3),
+                                              ('type', "GL_FLOAT")
+                                              ])]
+    # Add the normal vectors to the per-vertex attributes.
+    if export_normals:
+        per_vertex_attribute_desc.append(
+                OrderedDict([("attribute", 'VERTEX_ATTRIB_NORMAL'),
+                             ('size', 3),
+                             ('type', 'GL_FLOAT')
+                             ]))
+    # Add the texture coordinates to the per-vertex attributes.
+    for idx in range(num_uv_layers):
+        attribute_name = 'VERTEX_ATTRIB_TEX_COORD{}'.format(idx if idx else "")
+        per_vertex_attribute_desc.append(
+                OrderedDict([('attribute', attribute_name),
+                             ('size', 2),
+                             ('type', 'GL_FLOAT')
+                             ]))
+    # Add the tangents and the binormals of the first UV map to the per-vertex attributes.
+    if export_tangents:
+        for attribute_name in ('VERTEX_ATTRIB_TANGENT', 'VERTEX_ATTRIB_BINORMAL'):
+            per_vertex_attribute_desc.append(
+                    OrderedDict([('attribute', attribute_name),
+                                 ('size', 3),
+                                 ('type', 'GL_FLOAT')
+                                 ]))
+    # Add the bone weights and the bone indices to the per-vertex attributes.
+    if use_skinning:
+        for attribute_name in ('VERTEX_ATTRIB_BLEND_WEIGHT', 'VERTEX_ATTRIB_BLEND_INDEX'):
+            per_vertex_attribute_desc.append(
+                    OrderedDict([('attribute', attribute_name),
+                                 ('size', MAX_BONE_INFLUENCES),
+                                 ('type', 'GL_FLOAT')
+                                 ]))
+    return per_vertex_attribute_desc
+
+
+def make_attribute_precisions(position_precision=5, normal_precision=4, uv_precision=4):
+    """Returns the number of decimal places of every vertex attribute in compact output.
+    """
+    attribute_precisions = {'VERTEX_ATTRIB_POSITION': position_precision,
+                            'VERTEX_ATTRIB_NORMAL': normal_precision,
+                            'VERTEX_ATTRIB_TANGENT': normal_precision,
+                            'VERTEX_ATTRIB_BINORMAL': normal_precision,
+                            'VERTEX_ATTRIB_BLEND_WEIGHT': normal_precision,
+                            # The bone indices are integers, which are exact with any precision.
+                            'VERTEX_ATTRIB_BLEND_INDEX': 1}
+    for idx in range(8):
+        attribute_precisions['VERTEX_ATTRIB_TEX_COORD{}'.format(idx if idx else '')] = uv_precision
+    return attribute_precisions
+
+
+def build_meshes(name, attributes, processed_mesh, attribute_precisions):
+    """The merge stage without the materials: Converts a processed mesh into meshes of the exported file.
+
+    A mesh with more vertices than 16-bit indices can address is split into several meshes. Returns a tuple with
+    the list of meshes and a list with a tuple (mesh part ID, material key) for every part. The parts are numbered
+    across all meshes, into which the mesh is split.
+    """
+    stride = sum([pva['size'] for pva in attributes])
+    if np is not None:
+        split_meshes = split_mesh(processed_mesh)
+    else:
+        split_meshes = split_mesh_list(processed_mesh, stride)
+
+    meshes = []
+    part_keys = []
+    for processed_mesh in split_meshes:
+        parts = []
+        for material_key, indices, aabb in processed_mesh.parts:
+            mesh_part_id = '{}_part{}'.format(name, len(part_keys) + 1)
+            aabb_min, aabb_max = aabb
+            parts.append(OrderedDict([('id', mesh_part_id),
+                                      ('type', 'TRIANGLES'),
+                                      ('indices', ArrayTable('H', indices, 3)),
+                                      ('aabb', Table(aabb_min + aabb_max, 3,
+                                                     [attribute_precisions['VERTEX_ATTRIB_POSITION']] * 3))
+                                      ]))
+            part_keys.append((mesh_part_id, material_key))
+
+        vertex_attributes = ArrayTable('f', processed_mesh.vertices, stride,
+                                       [attribute_precisions[pva['attribute']]
+                                        for pva in attributes
+                                        for _ in range(pva['size'])])
+        meshes.append(OrderedDict([('attributes', attributes),
+                                   ('vertices', vertex_attributes),
+                                   ('parts', parts)
+                                   ]))
+    return meshes, part_keys
+
+
+def export_mesh_sources(sources, out_file, *,
+                        file_format='C3T',
+                        export_normals=True,
+                        export_uv_maps=True,
+                        use_vertex_cache_optimization=False,
+                        use_compact_output=False,
+                        attribute_precisions=None,
+                        profiler=None):
+    """Runs the read, process, merge and write stages of the mesh export for the mesh sources.
+
+    Every source becomes a node with its own mesh and every material name a plain material without textures, so
+    the file lacks the materials, skins and animations of an export from Blender. This is meant for benchmarking
+    and testing the core without Blender, e.g. with FakeMeshSource, and needs NumPy. The stages are recorded by the
+    profiler, if given. out_file has to be opened in text mode for 'C3T' and in binary mode for 'C3B'. Returns the
+    Model.
+    """
+    if profiler is None:
+        profiler = Profiler()
+    if attribute_precisions is None:
+        attribute_precisions = make_attribute_precisions()
+    profiler.start()
+    model = Model()
+    material_ids = {}
+    for source in sources:
+        num_uv_layers = min(8, source.num_uv_layers) if export_uv_maps else 0
+        attributes = make_attribute_desc(export_normals, num_uv_layers, False, False)
+        with profiler.stage('triangulate', source.name):
+            source.prepare(export_normals, False)
+        with profiler.stage('read_mesh', source.name):
+            mesh_data = source.read_mesh_data(export_normals, num_uv_layers)
+        with profiler.stage('process'):
+            processed_mesh = process_mesh_data(mesh_data, use_vertex_cache_optimization)
+        for step, seconds in processed_mesh.timings.items():
+            profiler.add_time(step, seconds, source.name)
+        profiler.count(source.name, triangles=sum(len(indices) for _, indices, _ in processed_mesh.parts) // 3,
+                       unique_vertices=len(processed_mesh.vertices))
+
+        with profiler.stage('merge', source.name):
+            meshes, part_keys = build_meshes(source.name, attributes, processed_mesh, attribute_precisions)
+            parts = []
+            for mesh_part_id, (material_index, _) in part_keys:
+                material_id = mesh_data.material_names[material_index] or 'mat'
+                if material_id not in material_ids:
+                    material_ids[material_id] = len(model.materials)
+                    model.materials.append(OrderedDict([('id', material_id),
+                                                        ('ambient', Inline((1.0, 1.0, 1.0))),
+                                                        ('diffuse', Inline((0.8, 0.8, 0.8))),
+                                                        ('emissive', Inline((0.8, 0.8, 0.8))),
+                                                        ('opacity', 1.0),
+                                                        ('specular', Inline((1.0, 1.0, 1.0))),
+                                                        ('shininess', 2.0)
+                                                        ]))
+                parts.append(OrderedDict([('meshpartid', mesh_part_id),
+                                          ('materialid', material_id),
+                                          ('uvMapping', Inline([[0]]))
+                                          ]))
+            model.meshes.extend(meshes)
+            model.nodes.append(OrderedDict([('id', source.name),
+                                            ('skeleton', False),
+                                            ('transform', Table([1.0, 0.0, 0.0, 0.0,
+                                                                 0.0, 1.0, 0.0, 0.0,
+                                                                 0.0, 0.0, 1.0, 0.0,
+                                                                 0.0, 0.0, 0.0, 1.0], 4)),
+                                            ('parts', parts)
+                                            ]))
+
+    with profiler.stage('write'):
+        if file_format == 'C3B':
+            writer = BinaryWriter()
+        else:
+            writer = JsonWriter(compact=use_compact_output)
+        writer.write(model, out_file.write)
+    profiler.stop()
+    return model
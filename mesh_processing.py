@@ -0,0 +1,558 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# ====---------------------------------------------------------------------====
+#     This is a Blender addon for exporting a scene to Cocos2d-x in
+#     its JSON file format (c3t).
+#     Created by Manuel Freiberger.
+#
+#     This module holds the processing stage of the mesh export. It works on
+#     plain arrays only and must not import bpy, so it can be run in worker
+#     processes.
+# ====---------------------------------------------------------------------====
+
+import hashlib
+import time
+from collections import OrderedDict, deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class MeshData:
+    """The data of a triangulated mesh, which has been read from Blender in bulk.
+
+    The loop_attributes are a float32 array with the interleaved vertex attributes of every loop. The
+    material_indices, loop_starts and loop_totals are int32 arrays with one entry per polygon. The material_names
+    hold the name of the material in every slot (None for an empty slot) and the layer_image_names hold a list
+    with the image name of every polygon (None without an image) per exported UV texture.
+    """
+    def __init__(self, loop_attributes, material_indices, loop_starts, loop_totals, material_names,
+                 layer_image_names):
+        self.loop_attributes = loop_attributes
+        self.material_indices = material_indices
+        self.loop_starts = loop_starts
+        self.loop_totals = loop_totals
+        self.material_names = material_names
+        self.layer_image_names = layer_image_names
+
+
+class ProcessedMesh:
+    """The geometry of a mesh after partitioning and deduplication.
+
+    The vertices are a float32 array with one row of attributes per unique vertex. The parts are a list of
+    (material_key, indices, aabb) tuples. The material_key is a tuple of the material index and the image names of
+    the part's UV textures, indices is an array of vertex indices and the aabb is a tuple of the min and the max
+    corner. Without NumPy, the vertices are a flat list and the indices are lists.
+
+    If the index buffers have been optimized for the vertex cache, cache_misses is a tuple with the number of
+    simulated cache misses of all parts before and after the optimization. Otherwise, it is None.
+
+    The timings map the name of every processing step to the time in seconds, which it took. They are measured by
+    process_mesh_data(), so the time spent in worker processes can be reported.
+    """
+    def __init__(self, vertices, parts, cache_misses=None, timings=None):
+        self.vertices = vertices
+        self.parts = parts
+        self.cache_misses = cache_misses
+        self.timings = timings
+
+
+def hash_mesh_data(mesh_data, salt):
+    """Computes a content hash of the mesh data. The salt is hashed first and should identify the export options.
+    """
+    digest = hashlib.sha1(salt.encode('utf-8'))
+    for data in (mesh_data.loop_attributes, mesh_data.material_indices, mesh_data.loop_starts,
+                 mesh_data.loop_totals):
+        digest.update(data.tobytes())
+    digest.update(repr((mesh_data.material_names, mesh_data.layer_image_names)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def process_mesh_data(mesh_data, use_vertex_cache_optimization=False):
+    """Partitions the mesh by (material, textures)-combinations and deduplicates its vertices.
+
+    If use_vertex_cache_optimization is set, the triangles of every part are reordered by optimize_vertex_cache()
+    and the vertices are reordered by reorder_vertices_by_first_use() afterwards.
+    """
+    timings = OrderedDict()
+    time_stamp = time.perf_counter()
+    part_material_keys, part_loop_indices = partition_polygons(
+        mesh_data.material_indices, mesh_data.loop_starts, mesh_data.loop_totals, mesh_data.material_names,
+        mesh_data.layer_image_names)
+    timings['partition'] = time.perf_counter() - time_stamp
+    time_stamp += timings['partition']
+    vertices, part_vertex_indices, part_aabbs = deduplicate_vertices(mesh_data.loop_attributes, part_loop_indices)
+    timings['deduplicate'] = time.perf_counter() - time_stamp
+    time_stamp += timings['deduplicate']
+    processed_mesh = ProcessedMesh(vertices, list(zip(part_material_keys, part_vertex_indices, part_aabbs)),
+                                   timings=timings)
+    if use_vertex_cache_optimization:
+        optimize_parts(processed_mesh, lambda indices: np.array(optimize_vertex_cache(indices.tolist()),
+                                                                dtype=indices.dtype))
+        reorder_vertices_by_first_use(processed_mesh)
+        timings['optimize_vertex_cache'] = time.perf_counter() - time_stamp
+    return processed_mesh
+
+
+def optimize_parts(processed_mesh, optimize):
+    """Replaces the indices of every part of the processed mesh by optimize(indices), unless this gives more misses.
+
+    Counts the simulated vertex cache misses before and after the optimization in processed_mesh.cache_misses.
+    """
+    misses_before = misses_after = 0
+    parts = []
+    for material_key, indices, aabb in processed_mesh.parts:
+        num_misses = count_cache_misses(indices)
+        misses_before += num_misses
+        optimized_indices = optimize(indices)
+        num_optimized_misses = count_cache_misses(optimized_indices)
+        if num_optimized_misses < num_misses:
+            indices = optimized_indices
+            num_misses = num_optimized_misses
+        misses_after += num_misses
+        parts.append((material_key, indices, aabb))
+    processed_mesh.parts = parts
+    processed_mesh.cache_misses = (misses_before, misses_after)
+
+
+def partition_polygons(material_indices, loop_starts, loop_totals, material_names, layer_image_names):
+    """Splits the polygons into parts with a common (material, textures)-combination.
+
+    The material index and the images of the UV textures are combined into one integer key per polygon and the
+    polygons are grouped by this key. Groups whose material slots hold the same material are merged.
+
+    Returns a list with a material key per part, which is a tuple of the material index and the image names of the
+    part's first polygon, and a list with the loop indices per part. The parts are ordered by their first polygon.
+    """
+    # Map the image names to integer codes.
+    image_codes = {}
+    keys = material_indices.astype(np.int64)
+    for image_names in layer_image_names:
+        codes = np.array([image_codes.setdefault(name, len(image_codes)) for name in image_names], dtype=np.int64)
+        # Compact the key after every UV layer such that it cannot overflow.
+        keys = np.unique(keys * (len(image_codes) + 1) + codes, return_inverse=True)[1].ravel()
+
+    part_polygons = OrderedDict()
+    for polygons in group_indices_by_key(keys):
+        first = polygons[0]
+        material_index = int(material_indices[first])
+        image_names = tuple(names[first] for names in layer_image_names)
+        # Different material slots can hold the same material, so the groups have to be merged by the material.
+        groups = part_polygons.setdefault((material_names[material_index], image_names),
+                                          ((material_index, image_names), []))[1]
+        groups.append(polygons)
+
+    part_material_keys = []
+    part_loop_indices = []
+    for material_key, groups in part_polygons.values():
+        polygons = np.sort(np.concatenate(groups)) if len(groups) > 1 else groups[0]
+        part_material_keys.append(material_key)
+        part_loop_indices.append(expand_loop_indices(loop_starts[polygons], loop_totals[polygons]))
+    return part_material_keys, part_loop_indices
+
+
+def group_indices_by_key(keys):
+    """Groups the indices of an integer key array by equal keys.
+
+    Returns a list with one sorted index array per distinct key. The groups are ordered by their first index.
+    """
+    if not len(keys):
+        return []
+    # A stable sort keeps the indices within a group in ascending order.
+    order = np.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+    group_starts = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+    groups = np.split(order, group_starts)
+    groups.sort(key=lambda group: group[0])
+    return groups
+
+
+def triangulate_quads(loop_starts, loop_totals, loop_positions):
+    """Splits the triangles and quads given by their loop_starts and loop_totals into triangles.
+
+    A quad is split along its shorter diagonal, which is computed from the positions of its loops, like the
+    'Shortest Diagonal' method of Blender's triangulation does. Returns a tuple (triangle_loops, polygon_indices)
+    of int32 arrays, which hold the three loop indices and the index of the polygon of every triangle.
+    """
+    num_polygon_triangles = loop_totals - 2
+    polygon_indices = np.repeat(np.arange(len(loop_totals), dtype=np.int32), num_polygon_triangles)
+    # The index of every triangle within its polygon, 0 or 1, and the loop start of its polygon.
+    offsets = (np.arange(len(polygon_indices), dtype=np.int32)
+               - np.repeat(np.cumsum(num_polygon_triangles) - num_polygon_triangles, num_polygon_triangles))
+    starts = loop_starts[polygon_indices]
+    # Split along the diagonal from the first to the third loop by default.
+    triangle_loops = np.column_stack([starts, starts + offsets + 1, starts + offsets + 2])
+
+    quad_starts = loop_starts[loop_totals == 4]
+    diagonals_02 = loop_positions[quad_starts + 2] - loop_positions[quad_starts]
+    diagonals_13 = loop_positions[quad_starts + 3] - loop_positions[quad_starts + 1]
+    is_flipped = np.zeros(len(loop_totals), dtype=bool)
+    is_flipped[loop_totals == 4] = (np.einsum('ij,ij->i', diagonals_13, diagonals_13)
+                                    < np.einsum('ij,ij->i', diagonals_02, diagonals_02))
+    flipped = is_flipped[polygon_indices]
+    # Split along the diagonal from the second to the fourth loop, which keeps the winding of the quad.
+    triangle_loops[flipped] = (starts[flipped, np.newaxis]
+                               + np.where(offsets[flipped, np.newaxis] == 0, [0, 1, 3], [1, 2, 3]))
+    return triangle_loops.astype(np.int32).ravel(), polygon_indices
+
+
+def expand_loop_indices(loop_starts, loop_totals):
+    """Returns the indices of all loops of the polygons given by their loop_starts and loop_totals.
+    """
+    # Each loop index is its polygon's start plus its offset within the polygon.
+    polygon_offsets = np.cumsum(loop_totals) - loop_totals
+    return (np.repeat(loop_starts - polygon_offsets, loop_totals)
+            + np.arange(int(loop_totals.sum()), dtype=loop_starts.dtype))
+
+
+def deduplicate_vertices(loop_attributes, part_loop_indices):
+    """Builds a vertex buffer without duplicates, which is shared by all mesh parts.
+
+    The loop_attributes are the per-loop vertex attributes of a MeshData and
+    part_loop_indices is a list with an array of loop indices per mesh part. Every row of the attributes is treated
+    as an opaque sequence of bytes, so the rows can be uniquified in a single sort rather than by hashing Python
+    tuples. The vertices are numbered in the order in which they are first used by the parts.
+
+    Returns a tuple (vertices, part_vertex_indices, part_aabbs). The vertices is a float32 array with the unique
+    attributes per row, part_vertex_indices holds an array of vertex indices per part and part_aabbs holds the
+    (min, max) corners of the bounding box of the vertices, which are referenced by a part.
+    """
+    part_sizes = [len(loop_indices) for loop_indices in part_loop_indices]
+    if not sum(part_sizes):
+        return (np.empty((0, loop_attributes.shape[1]), dtype=np.float32),
+                [np.empty(0, dtype=np.int64) for _ in part_sizes],
+                [compute_aabb(np.empty((0, 3), dtype=np.float32)) for _ in part_sizes])
+
+    # Adding zero turns -0.0 into 0.0, which otherwise would have a different bit pattern.
+    attributes = np.ascontiguousarray(loop_attributes[np.concatenate(part_loop_indices)] + np.float32(0))
+    rows = attributes.view(np.dtype((np.void, attributes.dtype.itemsize * attributes.shape[1]))).ravel()
+    _, first_use, inverse = np.unique(rows, return_index=True, return_inverse=True)
+
+    # np.unique() sorts the rows. Number the vertices in the order in which they have been used first instead.
+    order = np.argsort(first_use)
+    new_index = np.empty_like(order)
+    new_index[order] = np.arange(len(order))
+    vertices = attributes[first_use[order]]
+    indices = new_index[inverse.ravel()]
+
+    part_ends = np.cumsum(part_sizes)
+    part_vertex_indices = [indices[part_end - part_size:part_end]
+                           for part_end, part_size in zip(part_ends, part_sizes)]
+    # The loops of a part are exactly the vertices, which the part references, so the bounding box is reduced over
+    # the positions of its loops.
+    part_aabbs = [compute_aabb(attributes[part_end - part_size:part_end, :3])
+                  for part_end, part_size in zip(part_ends, part_sizes)]
+    return vertices, part_vertex_indices, part_aabbs
+
+
+def compute_aabb(positions):
+    """Returns the (min, max) corners of the axis-aligned bounding box of an array with one position per row.
+
+    The box of no positions is empty and placed at the origin.
+    """
+    if not len(positions):
+        return [0.0] * 3, [0.0] * 3
+    return positions.min(axis=0).tolist(), positions.max(axis=0).tolist()
+
+
+def compute_aabb_per_vertex(positions):
+    """The fallback of compute_aabb() for a list of positions.
+    """
+    if not positions:
+        return [0.0] * 3, [0.0] * 3
+    return [min(coords) for coords in zip(*positions)], [max(coords) for coords in zip(*positions)]
+
+
+def reorder_vertices_by_first_use(processed_mesh):
+    """Renumbers the vertices of the processed mesh in the order in which the index buffers of its parts use them.
+
+    The vertices of the first triangles are then stored at the start of the vertex buffer, so a draw call reads the
+    vertex buffer almost sequentially. Without this pass, the vertices would keep the order of the triangles before
+    the vertex cache optimization.
+    """
+    if not processed_mesh.parts:
+        return
+    all_indices = np.concatenate([indices for _, indices, _ in processed_mesh.parts])
+    if not len(all_indices):
+        return
+    used_vertices, first_use = np.unique(all_indices, return_index=True)
+    order = used_vertices[np.argsort(first_use)]
+    new_index = np.empty(len(processed_mesh.vertices), dtype=all_indices.dtype)
+    new_index[order] = np.arange(len(order), dtype=all_indices.dtype)
+    processed_mesh.vertices = processed_mesh.vertices[order]
+    processed_mesh.parts = [(material_key, new_index[indices], aabb)
+                            for material_key, indices, aabb in processed_mesh.parts]
+
+
+def reorder_vertex_list_by_first_use(processed_mesh, stride):
+    """The fallback of reorder_vertices_by_first_use() for a processed mesh without NumPy arrays.
+
+    The vertices of such a mesh are a flat list with stride values per vertex.
+    """
+    new_index = {}
+    order = []
+    for _, indices, _ in processed_mesh.parts:
+        for idx in indices:
+            if idx not in new_index:
+                new_index[idx] = len(order)
+                order.append(idx)
+    vertices = processed_mesh.vertices
+    processed_mesh.vertices = [value for idx in order for value in vertices[idx * stride:(idx + 1) * stride]]
+    processed_mesh.parts = [(material_key, [new_index[idx] for idx in indices], aabb)
+                            for material_key, indices, aabb in processed_mesh.parts]
+
+
+# Cocos2d-x stores the vertex indices as unsigned 16-bit integers, which limits the number of vertices per mesh.
+MAX_MESH_VERTICES = 65535
+
+
+def split_mesh(processed_mesh, max_vertices=MAX_MESH_VERTICES):
+    """Splits a processed mesh into meshes with at most max_vertices vertices each.
+
+    The triangles of all parts are split recursively at the median of their centroids along the longest extent of
+    the centroids, until every cluster uses few enough vertices. This keeps the triangles of a cluster spatially
+    coherent. Every cluster becomes a ProcessedMesh with its own vertex buffer and with the pieces of the parts,
+    which have triangles in it. Within a piece, the triangles keep their order and the vertices are numbered by
+    their first use, so an optimized vertex cache and vertex fetch order is preserved.
+
+    Returns a list of processed meshes, which is just [processed_mesh] if the mesh does not have to be split.
+    """
+    vertices = processed_mesh.vertices
+    if len(vertices) <= max_vertices:
+        return [processed_mesh]
+    triangles = np.concatenate([indices for _, indices, _ in processed_mesh.parts]).reshape(-1, 3)
+    triangle_parts = np.repeat(np.arange(len(processed_mesh.parts)),
+                               [len(indices) // 3 for _, indices, _ in processed_mesh.parts])
+    centroids = vertices[triangles, :3].mean(axis=1)
+
+    clusters = []
+    pending_clusters = [np.arange(len(triangles))]
+    while pending_clusters:
+        cluster = pending_clusters.pop()
+        if len(np.unique(triangles[cluster])) <= max_vertices:
+            clusters.append(cluster)
+            continue
+        cluster_centroids = centroids[cluster]
+        axis = int(np.argmax(cluster_centroids.max(axis=0) - cluster_centroids.min(axis=0)))
+        order = np.argsort(cluster_centroids[:, axis], kind='mergesort')
+        median = len(cluster) // 2
+        # Sorting the halves restores the original order of the triangles. The second half is pushed first, so
+        # the clusters come out in the order of their first triangle.
+        pending_clusters.append(np.sort(cluster[order[median:]]))
+        pending_clusters.append(np.sort(cluster[order[:median]]))
+
+    processed_meshes = []
+    for cluster in clusters:
+        cluster_indices = triangles[cluster].ravel()
+        used_vertices, first_use, inverse = np.unique(cluster_indices, return_index=True, return_inverse=True)
+        order = np.argsort(first_use)
+        new_index = np.empty_like(order)
+        new_index[order] = np.arange(len(order))
+        cluster_vertices = vertices[used_vertices[order]]
+        cluster_indices = new_index[inverse.ravel()]
+
+        parts = []
+        cluster_parts = triangle_parts[cluster]
+        for part_idx in np.unique(cluster_parts):
+            material_key = processed_mesh.parts[part_idx][0]
+            indices = cluster_indices.reshape(-1, 3)[cluster_parts == part_idx].ravel()
+            parts.append((material_key, indices, compute_aabb(cluster_vertices[indices, :3])))
+        processed_meshes.append(ProcessedMesh(cluster_vertices, parts))
+    return processed_meshes
+
+
+def split_mesh_list(processed_mesh, stride, max_vertices=MAX_MESH_VERTICES):
+    """The fallback of split_mesh() for a processed mesh without NumPy arrays.
+
+    The vertices of such a mesh are a flat list with stride values per vertex. The triangles are visited in their
+    order and a new mesh is started whenever a triangle would exceed max_vertices.
+    """
+    vertices = processed_mesh.vertices
+    if len(vertices) // stride <= max_vertices:
+        return [processed_mesh]
+
+    processed_meshes = []
+    new_index = {}
+    cluster_vertices = []
+    parts = []
+
+    def add_part(material_key, indices):
+        if indices:
+            positions = [cluster_vertices[idx * stride:idx * stride + 3] for idx in set(indices)]
+            parts.append((material_key, indices, compute_aabb_per_vertex(positions)))
+
+    for material_key, part_indices, _ in processed_mesh.parts:
+        indices = []
+        for corner in range(0, len(part_indices), 3):
+            triangle = part_indices[corner:corner + 3]
+            num_new_vertices = len(set(idx for idx in triangle if idx not in new_index))
+            if len(new_index) + num_new_vertices > max_vertices:
+                add_part(material_key, indices)
+                processed_meshes.append(ProcessedMesh(cluster_vertices, parts))
+                new_index = {}
+                cluster_vertices = []
+                parts = []
+                indices = []
+            for idx in triangle:
+                if idx not in new_index:
+                    new_index[idx] = len(new_index)
+                    cluster_vertices.extend(vertices[idx * stride:(idx + 1) * stride])
+                indices.append(new_index[idx])
+        add_part(material_key, indices)
+    if parts:
+        processed_meshes.append(ProcessedMesh(cluster_vertices, parts))
+    return processed_meshes
+
+
+# The parameters of the vertex cache optimization. See Tom Forsyth, "Linear-Speed Vertex Cache Optimisation".
+VERTEX_CACHE_SIZE = 32
+CACHE_DECAY_POWER = 1.5
+LAST_TRIANGLE_SCORE = 0.75
+VALENCE_BOOST_SCALE = 2.0
+VALENCE_BOOST_POWER = 0.5
+
+# The size of the FIFO cache, which is simulated to count the cache misses. This is a typical size for the
+# post-transform cache of mobile GPUs.
+SIMULATED_CACHE_SIZE = 16
+
+
+def _make_cache_position_scores():
+    """Returns the score of a vertex for every position in the modelled LRU cache.
+    """
+    scores = []
+    for position in range(VERTEX_CACHE_SIZE):
+        if position < 3:
+            # The vertices of the last triangle get a fixed score, so the next triangle does not simply reuse the
+            # edge of the last one, which would give long strips.
+            scores.append(LAST_TRIANGLE_SCORE)
+        else:
+            scores.append((1.0 - (position - 3) / (VERTEX_CACHE_SIZE - 3)) ** CACHE_DECAY_POWER)
+    return scores
+
+
+CACHE_POSITION_SCORES = _make_cache_position_scores()
+
+
+def optimize_vertex_cache(indices):
+    """Reorders the triangles of a triangle list to reduce the misses of the GPU's post-transform vertex cache.
+
+    This is Tom Forsyth's greedy algorithm: The vertices are scored by their position in a modelled LRU cache and by
+    the number of triangles, which still use them. The next triangle is the one with the highest score among the
+    triangles of the cached vertices. The indices are a list with three vertex indices per triangle. Returns a list
+    with the reordered indices. The orientation of the triangles is kept.
+    """
+    num_triangles = len(indices) // 3
+    if num_triangles < 2:
+        return list(indices)
+
+    # Renumber the vertices densely, because the indices of a part can refer to a much larger vertex buffer.
+    local_index = {}
+    triangle_vertices = [local_index.setdefault(idx, len(local_index)) for idx in indices]
+    num_vertices = len(local_index)
+
+    # The triangles, which use a vertex and have not been emitted yet.
+    vertex_triangles = [[] for _ in range(num_vertices)]
+    for corner, vertex in enumerate(triangle_vertices):
+        vertex_triangles[vertex].append(corner // 3)
+    cache_positions = [-1] * num_vertices
+
+    valence_scores = [0.0] + [VALENCE_BOOST_SCALE * valence ** -VALENCE_BOOST_POWER
+                              for valence in range(1, max(len(triangles) for triangles in vertex_triangles) + 1)]
+
+    def vertex_score(vertex):
+        num_triangles_left = len(vertex_triangles[vertex])
+        if not num_triangles_left:
+            return -1.0
+        position = cache_positions[vertex]
+        score = CACHE_POSITION_SCORES[position] if position >= 0 else 0.0
+        return score + valence_scores[num_triangles_left]
+
+    vertex_scores = [vertex_score(vertex) for vertex in range(num_vertices)]
+    triangle_scores = [vertex_scores[triangle_vertices[corner]]
+                       + vertex_scores[triangle_vertices[corner + 1]]
+                       + vertex_scores[triangle_vertices[corner + 2]]
+                       for corner in range(0, len(triangle_vertices), 3)]
+    triangle_emitted = [False] * num_triangles
+
+    cache = []
+    result = []
+    best_triangle = max(range(num_triangles), key=triangle_scores.__getitem__)
+    # The position from which the triangles are scanned if none of the cached vertices has a triangle left.
+    next_unemitted = 0
+    for _ in range(num_triangles):
+        if best_triangle < 0:
+            while triangle_emitted[next_unemitted]:
+                next_unemitted += 1
+            best_triangle = next_unemitted
+
+        corner = 3 * best_triangle
+        triangle_emitted[best_triangle] = True
+        result.extend(indices[corner:corner + 3])
+        emitted_vertices = triangle_vertices[corner:corner + 3]
+        for vertex in emitted_vertices:
+            vertex_triangles[vertex].remove(best_triangle)
+
+        # Move the vertices of the emitted triangle to the front of the cache.
+        cache = emitted_vertices + [vertex for vertex in cache if vertex not in emitted_vertices]
+        evicted_vertices = cache[VERTEX_CACHE_SIZE:]
+        del cache[VERTEX_CACHE_SIZE:]
+        for vertex in evicted_vertices:
+            cache_positions[vertex] = -1
+        for position, vertex in enumerate(cache):
+            cache_positions[vertex] = position
+
+        # Rescore the vertices, whose cache position has changed, and their triangles.
+        for vertex in cache + evicted_vertices:
+            new_score = vertex_score(vertex)
+            delta = new_score - vertex_scores[vertex]
+            vertex_scores[vertex] = new_score
+            for triangle in vertex_triangles[vertex]:
+                triangle_scores[triangle] += delta
+
+        # Pick the best triangle of the cached vertices.
+        best_triangle = -1
+        best_score = -1.0
+        for vertex in cache:
+            for triangle in vertex_triangles[vertex]:
+                if triangle_scores[triangle] > best_score:
+                    best_score = triangle_scores[triangle]
+                    best_triangle = triangle
+    return result
+
+
+def count_cache_misses(indices, cache_size=SIMULATED_CACHE_SIZE):
+    """Counts the misses of a simulated FIFO vertex cache when drawing the indices.
+
+    The average cache miss ratio (ACMR) is the number of misses divided by the number of triangles.
+    """
+    cache = deque()
+    cached_vertices = set()
+    num_misses = 0
+    for idx in (indices.tolist() if hasattr(indices, 'tolist') else indices):
+        if idx not in cached_vertices:
+            num_misses += 1
+            cache.append(idx)
+            cached_vertices.add(idx)
+            if len(cache) > cache_size:
+                cached_vertices.discard(cache.popleft())
+    return num_misses
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# ====---------------------------------------------------------------------====
+#     This is a Blender addon for exporting a scene to Cocos2d-x in
+#     its JSON file format (c3t).
+#     Created by Manuel Freiberger.
+#
+#     This module measures the time and the memory, which the stages of the
+#     export take. It must not import bpy.
+# ====---------------------------------------------------------------------====
+
+import json
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Profiler:
+    """Records the wall time, the number of calls and the peak memory per stage of the export.
+
+    The time and the peak memory of a stage are also recorded per object, if the name of the object is given,
+    together with counts like the number of vertices. A disabled profiler records nothing and costs next to nothing.
+
+    If trace_memory is set, the peak memory is measured as well. It is the largest amount of memory, which has been
+    allocated during a stage and was alive at the same time. It is measured with tracemalloc, which is started at
+    the beginning and stopped at the end of every stage, so the stages must not be nested. This covers the
+    allocations of Python and NumPy but not the ones of Blender itself. Tracing slows down Python code many times
+    more than code, which runs in C, so the times of a profile with memory are no good to find the slow stages. If
+    tracemalloc has already been started by someone else, the memory is not measured.
+    """
+    def __init__(self, enabled=False, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.stages = OrderedDict()
+        self.objects = OrderedDict()
+        self.total_time = 0.0
+        self._start_time = None
+
+    def start(self):
+        self._start_time = time.perf_counter()
+
+    def stop(self):
+        if self._start_time is not None:
+            self.total_time = time.perf_counter() - self._start_time
+
+    @contextmanager
+    def stage(self, name, object_name=None, trace_memory=True):
+        """Measures the code in the with-block as the stage with the given name.
+
+        Unset trace_memory to skip the memory of this stage, e.g. if it forks worker processes, which would inherit
+        the tracing.
+        """
+        if not self.enabled:
+            yield
+            return
+        trace_memory = trace_memory and self.trace_memory and not tracemalloc.is_tracing()
+        if trace_memory:
+            tracemalloc.start()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start_time
+            peak_memory = None
+            if trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.add_time(name, seconds, object_name, peak_memory)
+
+    def add_time(self, name, seconds, object_name=None, peak_memory=None):
+        """Adds a call of the stage with the given name, which has been measured elsewhere (e.g. in a worker process).
+        """
+        if not self.enabled:
+            return
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = OrderedDict([('time', 0.0), ('calls', 0), ('peak_memory', None)])
+        stage['time'] += seconds
+        stage['calls'] += 1
+        if peak_memory is not None:
+            stage['peak_memory'] = max(stage['peak_memory'] or 0, peak_memory)
+        if object_name is not None:
+            profile = self._get_object(object_name)
+            profile['stages'][name] = profile['stages'].get(name, 0.0) + seconds
+            if peak_memory is not None:
+                profile['peak_memory'] = max(profile['peak_memory'] or 0, peak_memory)
+
+    def count(self, object_name, **counts):
+        """Adds counts, e.g. the number of vertices, to the object with the given name.
+        """
+        if not self.enabled:
+            return
+        object_counts = self._get_object(object_name)['counts']
+        for key in sorted(counts):
+            object_counts[key] = object_counts.get(key, 0) + counts[key]
+
+    def _get_object(self, object_name):
+        profile = self.objects.get(object_name)
+        if profile is None:
+            profile = self.objects[object_name] = OrderedDict([('stages', OrderedDict()),
+                                                               ('counts', OrderedDict()),
+                                                               ('peak_memory', None)
+                                                               ])
+        return profile
+
+    def to_json_dict(self):
+        return OrderedDict([('total_time', self.total_time),
+                            ('stages', self.stages),
+                            ('objects', self.objects)
+                            ])
+
+    def save(self, filepath):
+        """Writes the profile as a JSON file, e.g. to track the export times over many exports.
+        """
+        with open(filepath, 'wt') as profile_file:
+            json.dump(self.to_json_dict(), profile_file, indent=4)
+            profile_file.write('\n')
+
+    def format_report(self, num_objects=5):
+        """Returns a multi-line report with all stages and the num_objects slowest objects.
+        """
+        lines = ['Export profile: {:.3f}s in total'.format(self.total_time)]
+        for name, stage in self.stages.items():
+            line = '  {:<20} {:9.3f}s {:6} calls'.format(name, stage['time'], stage['calls'])
+            if stage['peak_memory'] is not None:
+                line += ' {:10.1f} MB peak'.format(stage['peak_memory'] / (1 << 20))
+            lines.append(line)
+        slowest_objects = sorted(self.objects.items(), key=lambda item: -sum(item[1]['stages'].values()))
+        if slowest_objects:
+            lines.append('Slowest objects:')
+        for object_name, profile in slowest_objects[:num_objects]:
+            line = '  {:<20} {:9.3f}s'.format(object_name, sum(profile['stages'].values()))
+            if profile['peak_memory'] is not None:
+                line += ' {:10.1f} MB peak'.format(profile['peak_memory'] / (1 << 20))
+            counts = ', '.join('{} {}'.format(value, key) for key, value in profile['counts'].items())
+            if counts:
+                line += ' ' + counts
+            lines.append(line)
+        return '\n'.join(lines)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# ====---------------------------------------------------------------------====
+#     This is a Blender addon for exporting a scene to Cocos2d-x in
+#     its JSON file format (c3t).
+#     Created by Manuel Freiberger.
+#
+#     These tests check the parts of the export, which do not depend on
+#     Blender, with meshes from FakeMeshSource. They need NumPy and run in
+#     plain Python with "python -m pytest tests" or
+#     "python -m unittest discover tests".
+# ====---------------------------------------------------------------------====
+
+import io
+import math
+import os
+import struct
+import sys
+import unittest
+from collections import OrderedDict
+
+import numpy as np
+
+# The modules of the core are imported as top-level modules, because the add-on's package imports bpy.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from animation_processing import get_interpolation_error, lerp, reduce_keys, slerp  # noqa: E402
+from export_core import FakeMeshSource, Model, export_mesh_sources  # noqa: E402
+from mesh_processing import MAX_MESH_VERTICES, process_mesh_data, split_mesh, triangulate_quads  # noqa: E402
+from writers import BinaryWriter, Inline, JsonWriter  # noqa: E402
+
+
+def make_wavy_source(name='Wavy', size=12):
+    """Returns a grid with two materials, whose normals are per triangle, so that corners are duplicated.
+    """
+    grid = FakeMeshSource.grid(name, size, num_materials=2)
+    positions = grid.positions.copy()
+    positions[:, 2] = np.sin(positions[:, 0] * 7) * np.cos(positions[:, 1] * 5)
+    triangles = grid.triangles
+    # Give every triangle its own copy of its vertices with a flat normal.
+    corners = positions[triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    normals /= np.linalg.norm(normals, axis=1)[:, np.newaxis]
+    return FakeMeshSource(name, corners.reshape(-1, 3), np.arange(3 * len(triangles)).reshape(-1, 3),
+                          np.repeat(normals, 3, axis=0), [grid.uv_layers[0][triangles.ravel()]],
+                          grid.material_indices, grid.material_names)
+
+
+def get_triangle_rows(processed_mesh):
+    """Returns the sorted rows of the vertex attributes of the three corners of every triangle of all parts.
+    """
+    rows = np.concatenate([processed_mesh.vertices[indices].reshape(-1, 3 * processed_mesh.vertices.shape[1])
+                           for _, indices, _ in processed_mesh.parts])
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+class ProcessMeshDataTest(unittest.TestCase):
+    def test_deduplicate_and_partition(self):
+        source = make_wavy_source()
+        mesh_data = source.read_mesh_data(True, 1)
+        processed_mesh = process_mesh_data(mesh_data)
+
+        # The per-loop reference: The loops of every material in the order of the triangles.
+        reference_parts = OrderedDict()
+        for triangle, material_index in enumerate(mesh_data.material_indices):
+            loops = reference_parts.setdefault(int(material_index), [])
+            loops.extend(tuple(row) for row in mesh_data.loop_attributes[3 * triangle:3 * triangle + 3])
+        unique_vertices = set(loop for loops in reference_parts.values() for loop in loops)
+
+        self.assertEqual(len(processed_mesh.vertices), len(unique_vertices))
+        self.assertEqual([material_index for (material_index, _), _, _ in processed_mesh.parts],
+                         list(reference_parts))
+        for (material_index, image_names), indices, aabb in processed_mesh.parts:
+            self.assertEqual(image_names, (None,))
+            self.assertEqual([tuple(row) for row in processed_mesh.vertices[indices]],
+                             reference_parts[material_index])
+            positions = processed_mesh.vertices[indices, :3]
+            np.testing.assert_array_equal(aabb[0], positions.min(axis=0))
+            np.testing.assert_array_equal(aabb[1], positions.max(axis=0))
+
+    def test_vertex_cache_optimization_keeps_triangles(self):
+        mesh_data = make_wavy_source().read_mesh_data(True, 1)
+        processed_mesh = process_mesh_data(mesh_data)
+        optimized_mesh = process_mesh_data(mesh_data, use_vertex_cache_optimization=True)
+        np.testing.assert_array_equal(get_triangle_rows(optimized_mesh), get_triangle_rows(processed_mesh))
+        misses_before, misses_after = optimized_mesh.cache_misses
+        self.assertLessEqual(misses_after, misses_before)
+
+    def test_split_mesh(self):
+        processed_mesh = process_mesh_data(FakeMeshSource.grid('Grid', 300, num_materials=3).read_mesh_data(True, 1))
+        split_meshes = split_mesh(processed_mesh)
+        self.assertGreater(len(split_meshes), 1)
+        for mesh in split_meshes:
+            self.assertLessEqual(len(mesh.vertices), MAX_MESH_VERTICES)
+            for _, indices, _ in mesh.parts:
+                self.assertLess(int(indices.max()), len(mesh.vertices))
+        rows = np.concatenate([get_triangle_rows(mesh) for mesh in split_meshes])
+        np.testing.assert_array_equal(rows[np.lexsort(rows.T[::-1])], get_triangle_rows(processed_mesh))
+
+    def test_triangulate_quads(self):
+        # A triangle followed by two quads, the second of which is shorter along the diagonal from loop 1 to 3.
+        loop_starts = np.array([0, 3, 7], dtype=np.int32)
+        loop_totals = np.array([3, 4, 4], dtype=np.int32)
+        loop_positions = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0],
+                                   [0, 0, 0], [1, 0, 0], [1, 1, 0], [0, 1, 0],
+                                   [0, 0, 0], [1, 0, 0], [3, 3, 0], [0, 1, 0]], dtype=np.float32)
+        triangle_loops, polygon_indices = triangulate_quads(loop_starts, loop_totals, loop_positions)
+        self.assertEqual(triangle_loops.tolist(), [0, 1, 2, 3, 4, 5, 3, 5, 6, 7, 8, 10, 8, 9, 10])
+        self.assertEqual(polygon_indices.tolist(), [0, 1, 1, 2, 2])
+
+
+class WriterTest(unittest.TestCase):
+    def export(self, file_format, use_compact_output=False):
+        out_file = io.BytesIO() if file_format == 'C3B' else io.StringIO()
+        model = export_mesh_sources([make_wavy_source('A'), FakeMeshSource.grid('B', 300)], out_file,
+                                    file_format=file_format, use_compact_output=use_compact_output)
+        return model, out_file.getvalue()
+
+    def check_streaming(self, writer, model, expected):
+        out_file = io.BytesIO() if isinstance(writer, BinaryWriter) else io.StringIO()
+        meshes = model.meshes
+        model.meshes = []
+        writer.begin_stream(model, 'meshes', out_file)
+        for mesh in meshes:
+            writer.write_stream_item(mesh)
+        writer.end_stream(model)
+        self.assertEqual(out_file.getvalue(), expected)
+
+    def test_streaming_c3t(self):
+        model, expected = self.export('C3T')
+        self.check_streaming(JsonWriter(), model, expected)
+
+    def test_streaming_compact_c3t(self):
+        model, expected = self.export('C3T', use_compact_output=True)
+        self.check_streaming(JsonWriter(compact=True), model, expected)
+
+    def test_streaming_c3b(self):
+        model, expected = self.export('C3B')
+        self.check_streaming(BinaryWriter(), model, expected)
+
+    def test_c3b_animation_section(self):
+        model = Model()
+        model.animations_only = True
+        model.animations.append(OrderedDict([('id', 'Walk'),
+                                             ('length', 1.0),
+                                             ('bones', [OrderedDict([('boneId', 'Bone'),
+                                                                     ('keyframes', [OrderedDict([
+                                                                         ('keytime', 0.0),
+                                                                         ('rotation', Inline((0.0, 0.0, 0.0, 1.0)))
+                                                                     ])])
+                                                                     ])])
+                                             ]))
+        out_file = io.BytesIO()
+        BinaryWriter().write(model, out_file.write)
+        data = out_file.getvalue()
+
+        self.assertEqual(data[:4], b'C3B\0')
+        self.assertEqual(struct.unpack_from('<I', data, 6), (1,))
+        offset = 10
+        (id_length,) = struct.unpack_from('<I', data, offset)
+        ref_id = data[offset + 4:offset + 4 + id_length].decode('utf-8')
+        ref_type, section_offset = struct.unpack_from('<II', data, offset + 4 + id_length)
+        self.assertEqual((ref_id, ref_type), ('Walkanimation', BinaryWriter.ANIMATIONS))
+        # Bundle3D reads the number of animations in the section before the first ID.
+        num_animations, id_length = struct.unpack_from('<II', data, section_offset)
+        self.assertEqual(num_animations, 1)
+        self.assertEqual(data[section_offset + 8:section_offset + 8 + id_length], b'Walk')
+
+
+class ReduceKeysTest(unittest.TestCase):
+    def check_reduction(self, keytimes, values, tolerance, interpolate):
+        kept = reduce_keys(keytimes, values, tolerance, interpolate)
+        self.assertEqual(kept, sorted(set(kept)))
+        self.assertEqual((kept[0], kept[-1]), (0, len(values) - 1))
+        for start, end in zip(kept, kept[1:]):
+            duration = keytimes[end] - keytimes[start]
+            for key in range(start + 1, end):
+                interpolated = interpolate(values[start], values[end], (keytimes[key] - keytimes[start]) / duration)
+                self.assertLessEqual(get_interpolation_error(interpolated, values[key]), tolerance)
+        return kept
+
+    def test_translation(self):
+        keytimes = [frame / 24 for frame in range(300)]
+        values = [(math.sin(time * 3), time * 0.5, math.cos(time) ** 3) for time in keytimes]
+        for tolerance in (0.0001, 0.001, 0.01):
+            self.check_reduction(keytimes, values, tolerance, lerp)
+        self.assertLess(len(reduce_keys(keytimes, values, 0.01)), len(values) // 2)
+
+    def test_rotation(self):
+        keytimes = [frame / 24 for frame in range(200)]
+        values = []
+        for time in keytimes:
+            angle = math.sin(time * 2)
+            values.append((math.sin(angle / 2), 0.0, 0.0, math.cos(angle / 2)))
+        self.check_reduction(keytimes, values, 0.0001, slerp)
+
+    def test_linear_channel(self):
+        keytimes = list(range(300))
+        values = [(0.1 * time, 0.0, 0.0) for time in keytimes]
+        self.assertEqual(reduce_keys(keytimes, values, 0.0001), [0, 299])
+
+    def test_constant_channel_and_zero_tolerance(self):
+        keytimes = list(range(10))
+        self.assertEqual(reduce_keys(keytimes, [(1.0, 2.0, 3.0)] * 10, 0.0001), [0])
+        values = [(float(time), 0.0, 0.0) for time in keytimes]
+        self.assertEqual(reduce_keys(keytimes, values, 0.0), list(range(10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,590 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU General Public License as published by
+#  the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# ====---------------------------------------------------------------------====
+#     This is a Blender addon for exporting a scene to Cocos2d-x in
+#     its JSON file format (c3t).
+#     Created by Manuel Freiberger.
+#
+#     This module holds the serialization stage of the export, which writes
+#     the c3t and the c3b format. It must not import bpy.
+# ====---------------------------------------------------------------------====
+
+import re
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+from functools import partial
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class Table:
+    """A list wrapper, which adds an items_per_line attribute for pretty-printing.
+
+    The optional precisions hold the number of decimal places per column, which are used for compact output.
+    """
+    __slots__ = ('items', 'items_per_line', 'precisions')
+
+    def __init__(self, items, num_items_per_line=1, precisions=None):
+        self.items = list(items)
+        self.items_per_line = num_items_per_line
+        self.precisions = precisions
+
+    def append(self, item):
+        self.items.append(item)
+
+    def extend(self, items):
+        self.items.extend(items)
+
+
+class ArrayTable(Table):
+    """A Table, whose items are stored in a typed array of the standard array module.
+
+    The typecode is 'f' for 32-bit floats or one of the unsigned integer types, e.g. 'H' for 16-bit indices. Every
+    item takes 4 or 2 bytes instead of a pointer to a boxed Python number, which makes up most of the memory of the
+    vertices and indices of large meshes. The items can be a NumPy array, which is copied in bulk. The writers read
+    the array directly.
+    """
+    __slots__ = ()
+
+    def __init__(self, typecode, items, num_items_per_line=1, precisions=None):
+        data = array(typecode)
+        if np is not None and isinstance(items, np.ndarray):
+            data.frombytes(np.ascontiguousarray(items, dtype=typecode).tobytes())
+        else:
+            data.extend(items)
+        super().__init__((), num_items_per_line, precisions)
+        self.items = data
+
+
+class Inline:
+    """A wrapper to output lists in a single line.
+    """
+    def __init__(self, value):
+        self.value = value
+
+
+class JsonWriter:
+    """Serializes value in JSON format to fw.
+
+    This is a straight forward implementation of a basic JSON encoder. This encoder is used rather than Python's
+    standard json package because it allows to hook in custom formatting of tables. The output is collected in a
+    buffer, which is passed on to fw in large chunks.
+
+    In compact mode, the output has neither indentation nor line breaks and floats are written with the number of
+    decimal places given by the precisions of a Table or by float_precision. Trailing zeros are dropped.
+
+    Instead of write(), the methods begin_stream(), write_stream_item() and end_stream() write a value, one of
+    whose lists is passed in item by item. This allows to free every item as soon as it has been written.
+    """
+    # The number of characters which are buffered before they are passed on to fw.
+    BUFFER_SIZE = 1 << 20
+    # The number of table rows, which are formatted with a single call to str.format().
+    ROWS_PER_CHUNK = 1024
+    # Matches the trailing zeros of a formatted float (and the decimal point, if only zeros follow it).
+    _TRAILING_ZEROS = re.compile(r'(\.\d*?[1-9])0+(?!\d)|\.0+(?!\d)')
+
+    def __init__(self, compact=False, float_precision=6):
+        self.compact = compact
+        self.float_precision = float_precision
+        self.int_format = '{}'
+        self.float_format = '{}'
+        self.fw = None
+        self.inline = False
+        self._out_fw = None
+        self._buffer = []
+        self._buffered_size = 0
+        if compact:
+            self._newline = ''
+            self._indentation = ''
+            self._item_sep = ','
+            self._key_sep = ':'
+            self._table_int_format = '{}'
+            self._table_float_format = '{{:.{}f}}'.format(float_precision)
+            self.float_format = self._table_float_format
+        else:
+            self._newline = '\n'
+            self._indentation = '    '
+            self._item_sep = ', '
+            self._key_sep = ': '
+            self._table_int_format = '{:5}'
+            self._table_float_format = '{:12.7f}'
+
+    def write(self, value, fw):
+        self._out_fw = fw
+        self.fw = self._write_buffered
+        self._encode(value, 0)
+        self.fw('\n')
+        self._flush()
+
+    def begin_stream(self, value, key, out_file):
+        """Starts to write value to out_file. The list with the given key is streamed.
+
+        The items of the dictionary of value up to the key are written right away. Every item of the streamed list
+        has to be passed to write_stream_item() afterwards.
+        """
+        self._out_fw = out_file.write
+        self.fw = self._write_buffered
+        items = list(value.to_json_dict().items())
+        keys = [item_key for item_key, _ in items]
+        self._stream_key = key
+        self._num_stream_items = 0
+        self.fw('{')
+        sep = self._encode_dict_items(items[:keys.index(key)], 1, '')
+        self.fw('{}{}"{}"{}'.format(sep, self._newline + self._indentation, key, self._key_sep))
+
+    def write_stream_item(self, item):
+        """Writes the next item of the streamed list.
+        """
+        self.fw((self._item_sep if self._num_stream_items else '[') + self._newline + self._indentation * 2)
+        self._encode(item, 2)
+        self._num_stream_items += 1
+
+    def end_stream(self, value):
+        """Closes the streamed list and writes the remaining items of the dictionary of value.
+
+        The output is the same as the one of write() for a value, whose list holds all streamed items.
+        """
+        if self._num_stream_items:
+            self.fw(self._newline + self._indentation + ']')
+        else:
+            self.fw('[]')
+        items = list(value.to_json_dict().items())
+        keys = [item_key for item_key, _ in items]
+        self._encode_dict_items(items[keys.index(self._stream_key) + 1:], 1, ',')
+        self.fw(self._newline + '}\n')
+        self._flush()
+
+    def _write_buffered(self, s):
+        self._buffer.append(s)
+        self._buffered_size += len(s)
+        if self._buffered_size >= self.BUFFER_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            self._out_fw(''.join(self._buffer))
+            self._buffer = []
+            self._buffered_size = 0
+
+    def _format_float(self, value):
+        text = self.float_format.format(value)
+        if self.compact:
+            text = self._TRAILING_ZEROS.sub(r'\1', text)
+        return text
+
+    def _encode_list(self, lst, indent, items_per_line=1):
+        if not lst:
+            self.fw('[]')
+            return
+        indent += 1
+        nl = self._newline + self._indentation * indent
+        sep = ''
+        self.fw('[')
+        for idx in range(len(lst)):
+            self.fw(sep)
+            sep = self._item_sep
+            if not self.inline and idx % items_per_line == 0:
+                self.fw(nl)
+            self._encode(lst[idx], indent)
+        if not self.inline:
+            indent -= 1
+            nl = self._newline + self._indentation * indent
+            self.fw(nl)
+        self.fw(']')
+
+    def _encode_table(self, table, indent):
+        """Encodes a table of only floats or only integers in bulk.
+
+        The output is the same as the one of _encode_list() but the items are formatted a chunk of rows at a time.
+        Returns False, if the table has mixed types and must be encoded item by item.
+        """
+        items = table.items
+        items_per_line = table.items_per_line
+        if isinstance(items, array) and items:
+            # The type of the items follows from the array, so they do not have to be visited.
+            item_types = {float} if items.typecode in 'fd' else {int}
+        else:
+            item_types = set(map(type, items))
+        if item_types == {float}:
+            if self.compact and table.precisions:
+                item_formats = ['{{:.{}f}}'.format(precision) for precision in table.precisions]
+            else:
+                item_formats = [self._table_float_format] * items_per_line
+        elif item_types == {int}:
+            item_formats = [self._table_int_format] * items_per_line
+        else:
+            return False
+        strip_zeros = self.compact and item_types == {float}
+
+        nl = self._newline + self._indentation * (indent + 1)
+        row_sep = self._item_sep + nl
+        row_format = self._item_sep.join(item_formats)
+        chunk_size = self.ROWS_PER_CHUNK * items_per_line
+        chunk_format = row_sep.join([row_format] * self.ROWS_PER_CHUNK)
+        chunks = []
+        num_full_chunks = len(items) // chunk_size
+        for start in range(0, num_full_chunks * chunk_size, chunk_size):
+            chunks.append(chunk_format.format(*items[start:start + chunk_size]))
+        # The remaining rows, of which the last one may be incomplete.
+        remainder = items[num_full_chunks * chunk_size:]
+        if remainder:
+            num_rows, num_trailing_items = divmod(len(remainder), items_per_line)
+            formats = [row_format] * num_rows
+            if num_trailing_items:
+                formats.append(self._item_sep.join(item_formats[:num_trailing_items]))
+            chunks.append(row_sep.join(formats).format(*remainder))
+
+        sep = '[' + nl
+        for chunk in chunks:
+            if strip_zeros:
+                chunk = self._TRAILING_ZEROS.sub(r'\1', chunk)
+            self.fw(sep + chunk)
+            sep = row_sep
+        self.fw(self._newline + self._indentation * indent + ']')
+        return True
+
+    def _encode_dict(self, dct, indent):
+        if not dct:
+            self.fw('{}')
+            return
+        self.fw('{')
+        self._encode_dict_items(dct.items(), indent + 1, '')
+        self.fw(self._newline + self._indentation * indent + '}')
+
+    def _encode_dict_items(self, items, indent, sep):
+        """Encodes the key/value pairs of a dictionary, whose opening brace has been written.
+
+        The sep precedes the first pair and must be empty at the start of the dictionary. Returns the separator for
+        the next pair.
+        """
+        nl = self._newline + self._indentation * indent
+        for key, val in items:
+            self.fw('{}{}"{}"{}'.format(sep, nl, key, self._key_sep))
+            sep = ','
+            self._encode(val, indent)
+        return sep
+
+    def _encode(self, o, indent):
+        if isinstance(o, str):
+            self.fw('"{}"'.format(o))
+        elif o is None:
+            self.fw('null')
+        elif o is True:
+            self.fw('true')
+        elif o is False:
+            self.fw('false')
+        elif isinstance(o, int):
+            self.fw(self.int_format.format(o))
+        elif isinstance(o, float):
+            self.fw(self._format_float(o))
+        elif isinstance(o, (list, tuple)):
+            self._encode_list(o, indent)
+        elif isinstance(o, dict):
+            self._encode_dict(o, indent)
+        elif isinstance(o, Table):
+            if self.inline or not self._encode_table(o, indent):
+                int_format = self.int_format
+                float_format = self.float_format
+                self.int_format = self._table_int_format
+                self.float_format = self._table_float_format
+                self._encode_list(o.items, indent, o.items_per_line)
+                self.int_format = int_format
+                self.float_format = float_format
+        elif isinstance(o, Inline):
+            inline = self.inline
+            self.inline = True
+            self._encode(o.value, indent)
+            self.inline = inline
+        else:
+            self._encode_dict(o.to_json_dict(), indent)
+
+
+class BinaryWriter:
+    """Serializes value in the binary c3b format to fw.
+
+    The value has to provide the same dictionary via to_json_dict() as it does for the JsonWriter. A c3b file starts
+    with a header, which is followed by a table of references to the mesh, material and node sections and to one
+    section per animation. All numbers are stored as little-endian 32-bit values, except for the vertex indices,
+    which are unsigned 16-bit integers. Cocos2d-x reads the indices of all parts with this width, which is why the
+    exporter splits larger meshes.
+
+    Like the JsonWriter, the BinaryWriter can stream the meshes, materials or nodes. As the sizes of the sections
+    are not known in advance, the reference table and the number of streamed items are written as placeholders
+    and patched by end_stream(). The file must therefore be seekable.
+    """
+    # The reference types as understood by Cocos2d-x's Bundle3D.
+    NODE = 2
+    ANIMATIONS = 3
+    MATERIAL = 16
+    MESH = 34
+
+    # The flags of a keyframe, which tell the transform components stored in it.
+    KEYFRAME_ROTATION = 0x01
+    KEYFRAME_SCALE = 0x02
+    KEYFRAME_TRANSLATION = 0x04
+
+    def __init__(self):
+        self._buffer = None
+        self._out_file = None
+
+    def write(self, value, fw):
+        dct = value.to_json_dict()
+        sections = []
+        for ref_id, ref_type, _, write_section in self._get_sections(dct):
+            self._buffer = bytearray()
+            write_section()
+            sections.append((ref_id, ref_type, self._buffer))
+        self._buffer = None
+
+        # The offsets in the reference table are counted from the start of the file, so the size of the header has
+        # to be known first.
+        references = []
+        offset = self._get_header_size(ref_id for ref_id, _, _ in sections)
+        for ref_id, ref_type, section in sections:
+            references.append((ref_id, ref_type, offset))
+            offset += len(section)
+        fw(self._pack_header(dct['version'], references))
+        for _, _, section in sections:
+            fw(bytes(section))
+
+    def begin_stream(self, value, key, out_file):
+        """Starts to write value to out_file. The list with the given key ('meshes', 'materials' or 'nodes') is
+        streamed.
+
+        The header and the sections before the streamed one are written right away. Every item of the streamed list
+        has to be passed to write_stream_item() afterwards. The sections must not change apart from the streamed
+        list and the lists following it.
+        """
+        dct = value.to_json_dict()
+        self._out_file = out_file
+        self._stream_start = out_file.tell()
+        self._stream_key = key
+        self._stream_ref_ids = [ref_id for ref_id, _, _, _ in self._get_sections(dct)]
+        self._stream_write_item = self._get_item_writers()[key]
+        self._num_stream_items = 0
+        self._stream_offsets = []
+        out_file.write(self._pack_header(dct['version'], [(ref_id, 0, 0) for ref_id in self._stream_ref_ids]))
+        for _, _, section_key, write_section in self._get_sections(dct):
+            if section_key == key:
+                break
+            self._write_stream_section(write_section)
+        self._stream_offsets.append(out_file.tell() - self._stream_start)
+        # The number of items is patched by end_stream().
+        out_file.write(struct.pack('<I', 0))
+
+    def write_stream_item(self, item):
+        """Writes the next item of the streamed list.
+        """
+        self._buffer = bytearray()
+        self._stream_write_item(item)
+        self._out_file.write(bytes(self._buffer))
+        self._buffer = None
+        self._num_stream_items += 1
+
+    def end_stream(self, value):
+        """Writes the sections after the streamed one and patches the reference table and the number of streamed
+        items.
+        """
+        dct = value.to_json_dict()
+        sections = self._get_sections(dct)
+        if [ref_id for ref_id, _, _, _ in sections] != self._stream_ref_ids:
+            raise ValueError('The sections of a streamed c3b file must not change')
+        section_keys = [section_key for _, _, section_key, _ in sections]
+        for _, _, _, write_section in sections[section_keys.index(self._stream_key) + 1:]:
+            self._write_stream_section(write_section)
+
+        out_file = self._out_file
+        end = out_file.tell()
+        streamed_offset = self._stream_offsets[section_keys.index(self._stream_key)]
+        out_file.seek(self._stream_start + streamed_offset)
+        out_file.write(struct.pack('<I', self._num_stream_items))
+        out_file.seek(self._stream_start)
+        out_file.write(self._pack_header(dct['version'],
+                                         [(ref_id, ref_type, offset)
+                                          for (ref_id, ref_type, _, _), offset in zip(sections, self._stream_offsets)]))
+        out_file.seek(end)
+        self._out_file = None
+
+    def _write_stream_section(self, write_section):
+        self._stream_offsets.append(self._out_file.tell() - self._stream_start)
+        self._buffer = bytearray()
+        write_section()
+        self._out_file.write(bytes(self._buffer))
+        self._buffer = None
+
+    def _get_item_writers(self):
+        """Returns the function, which writes one item, for every list, which is stored as a counted list.
+        """
+        return OrderedDict([('meshes', self._write_mesh),
+                            ('materials', self._write_material),
+                            ('nodes', self._write_node)
+                            ])
+
+    def _get_sections(self, dct):
+        """Returns the sections of the file for the dictionary of an exporter.
+
+        Every section is a tuple (reference ID, reference type, key in dct, function which writes the section).
+        """
+        sections = []
+        item_writers = self._get_item_writers()
+        for ref_id, ref_type, key in (('mesh', self.MESH, 'meshes'),
+                                      ('material', self.MATERIAL, 'materials'),
+                                      ('node', self.NODE, 'nodes')):
+            if key in dct:
+                sections.append((ref_id, ref_type, key, partial(self._write_list, item_writers[key], dct[key])))
+        # Bundle3D looks up an animation by its ID with the suffix 'animation'.
+        for animation in dct.get('animations', []):
+            sections.append((animation['id'] + 'animation', self.ANIMATIONS, None,
+                             partial(self._write_animation, animation)))
+        return sections
+
+    @staticmethod
+    def _get_header_size(ref_ids):
+        return 4 + 2 + 4 + sum(4 + len(ref_id.encode('utf-8')) + 4 + 4 for ref_id in ref_ids)
+
+    def _pack_header(self, version, references):
+        """Packs the header, which consists of the identifier, the version and the reference table.
+
+        The references are tuples (reference ID, reference type, offset).
+        """
+        major, minor = (int(part) for part in version.split('.'))
+        header = bytearray(b'C3B\0')
+        header += struct.pack('<BBI', major, minor, len(references))
+        for ref_id, ref_type, offset in references:
+            header += self._pack_string(ref_id)
+            header += struct.pack('<II', ref_type, offset)
+        return bytes(header)
+
+    @staticmethod
+    def _pack_string(s):
+        data = s.encode('utf-8')
+        return struct.pack('<I', len(data)) + data
+
+    def _write_string(self, s):
+        self._buffer += self._pack_string(s)
+
+    def _write_uint(self, value):
+        self._buffer += struct.pack('<I', value)
+
+    def _write_array(self, typecode, values):
+        if isinstance(values, array) and values.typecode == typecode and sys.byteorder == 'little':
+            self._buffer += values
+            return
+        data = array(typecode, values)
+        if sys.byteorder != 'little':
+            data.byteswap()
+        self._buffer += data.tobytes()
+
+    def _write_floats(self, values):
+        self._write_array('f', values)
+
+    def _write_list(self, write_item, items):
+        self._write_uint(len(items))
+        for item in items:
+            write_item(item)
+
+    def _write_mesh(self, mesh):
+        self._write_uint(len(mesh['attributes']))
+        for attribute in mesh['attributes']:
+            self._write_uint(attribute['size'])
+            self._write_string(attribute['type'])
+            self._write_string(attribute['attribute'])
+        vertices = mesh['vertices'].items
+        self._write_uint(len(vertices))
+        self._write_floats(vertices)
+        self._write_uint(len(mesh['parts']))
+        for part in mesh['parts']:
+            self._write_string(part['id'])
+            indices = part['indices'].items
+            self._write_uint(len(indices))
+            self._write_array('H', indices)
+            self._write_floats(part['aabb'].items)
+
+    def _write_material(self, material):
+        self._write_string(material['id'])
+        self._write_floats(list(material['diffuse'].value)
+                           + list(material['ambient'].value)
+                           + list(material['emissive'].value)
+                           + [material['opacity']]
+                           + list(material['specular'].value)
+                           + [material['shininess']])
+        textures = material.get('textures', [])
+        self._write_uint(len(textures))
+        for texture in textures:
+            self._write_string(texture['id'])
+            self._write_string(texture['filename'])
+            # The UV offset and the UV scale.
+            self._write_floats((0.0, 0.0, 1.0, 1.0))
+            self._write_string(texture['type'])
+            self._write_string(texture['wrapModeU'])
+            self._write_string(texture['wrapModeV'])
+
+    def _write_node(self, node):
+        self._write_string(node['id'])
+        self._buffer += struct.pack('<?', node['skeleton'])
+        self._write_floats(node['transform'].items)
+        parts = node.get('parts', [])
+        self._write_uint(len(parts))
+        for part in parts:
+            self._write_string(part['meshpartid'])
+            self._write_string(part['materialid'])
+            bones = part.get('bones', [])
+            self._write_uint(len(bones))
+            for bone in bones:
+                self._write_string(bone['node'])
+                self._write_floats(bone['transform'].items)
+            uv_mapping = part['uvMapping'].value
+            self._write_uint(len(uv_mapping))
+            for texture_indices in uv_mapping:
+                self._write_uint(len(texture_indices))
+                self._write_array('I', texture_indices)
+        children = node.get('children', [])
+        self._write_uint(len(children))
+        for child in children:
+            self._write_node(child)
+
+    def _write_animation(self, animation):
+        # Since version 0.6, Bundle3D expects the number of animations at the start of an animation section. Every
+        # section holds a single animation, so that it can be looked up by its ID.
+        self._write_uint(1)
+        self._write_string(animation['id'])
+        self._write_floats([animation['length']])
+        self._write_uint(len(animation['bones']))
+        for bone in animation['bones']:
+            self._write_string(bone['boneId'])
+            self._write_uint(len(bone['keyframes']))
+            for keyframe in bone['keyframes']:
+                self._write_floats([keyframe['keytime']])
+                flags = 0
+                values = []
+                for key, flag in (('rotation', self.KEYFRAME_ROTATION),
+                                  ('scale', self.KEYFRAME_SCALE),
+                                  ('translation', self.KEYFRAME_TRANSLATION)):
+                    if key in keyframe:
+                        flags |= flag
+                        values.extend(keyframe[key].value)
+                self._buffer += struct.pack('<B', flags)
+                self._write_floats(values)